@@ -29,7 +29,7 @@ from utils import (
     validate_package_name, safe_path_join, PACKAGE_SKIP_FLAG,
     BuildUtils, BUILD_ROOT, CACHE_PATH, TEMP_CHROOT_ID_MIN, TEMP_CHROOT_ID_MAX, 
     SEPARATOR_WIDTH, GIT_COMMAND_TIMEOUT, import_gpg_keys, upload_packages,
-    safe_command_execution
+    safe_command_execution, find_strongly_connected_components, extract_dep_name
 )
 
 class PackageBuilder:
@@ -563,7 +563,7 @@ echo "CHECKDEPENDS_END"
         failed_deps = []
         for dep_str in all_deps:
             # Extract package name (remove version constraints)
-            dep_name = dep_str.split('=')[0].split('>')[0].split('<')[0].strip()
+            dep_name = extract_dep_name(dep_str)
             
             # Check direct dependency
             if dep_name in failed_names:
@@ -604,7 +604,7 @@ echo "CHECKDEPENDS_END"
             pkg_name = pkg['name']
             provides_map[pkg_name] = pkg_name  # Self-reference
             for provide in pkg.get('provides', []):
-                provide_name = provide.split('=')[0].strip()
+                provide_name = provide.partition('=')[0].strip()
                 provides_map[provide_name] = pkg_name
         
         # Filter out packages with skip=1
@@ -800,13 +800,13 @@ echo "CHECKDEPENDS_END"
                 runtime_providers = set()
                 for dep_type in ['depends', 'makedepends']:
                     for dep_str in pkg.get(dep_type, []):
-                        dep_name = dep_str.split('=')[0].split('>')[0].split('<')[0].strip()
+                        dep_name = extract_dep_name(dep_str)
                         resolved = resolve_dep(dep_name)
                         if resolved and resolved != pkg_name and resolved in all_pkg_names:
                             runtime_providers.add(resolved)
                 for dep_type in ['depends', 'makedepends', 'checkdepends']:
                     for dep_str in pkg.get(dep_type, []):
-                        dep_name = dep_str.split('=')[0].split('>')[0].split('<')[0].strip()
+                        dep_name = extract_dep_name(dep_str)
                         resolved = resolve_dep(dep_name)
                         if resolved and resolved != pkg_name and resolved in all_pkg_names:
                             # Skip in-cycle deps for stage 1 (breaking the cycle)
@@ -827,46 +827,7 @@ echo "CHECKDEPENDS_END"
 
         # Break cycles in remaining_deps by dropping checkdepends-only edges.
         # Detect SCCs via Tarjan; for each SCC > 1, remove checkonly edges between members.
-        def _find_sccs(graph):
-            idx_counter = [0]
-            stk = []
-            idx = {}
-            low = {}
-            on_stk = {}
-            out = []
-            def strong(n):
-                idx[n] = idx_counter[0]
-                low[n] = idx_counter[0]
-                idx_counter[0] += 1
-                stk.append(n)
-                on_stk[n] = True
-                for s in graph.get(n, set()):
-                    if s not in idx:
-                        strong(s)
-                        low[n] = min(low[n], low[s])
-                    elif on_stk.get(s):
-                        low[n] = min(low[n], idx[s])
-                if low[n] == idx[n]:
-                    comp = []
-                    while True:
-                        w = stk.pop()
-                        on_stk[w] = False
-                        comp.append(w)
-                        if w == n:
-                            break
-                    out.append(comp)
-            import sys as _sys
-            _old_limit = _sys.getrecursionlimit()
-            _sys.setrecursionlimit(max(_old_limit, len(graph) + 100))
-            try:
-                for n in list(graph):
-                    if n not in idx:
-                        strong(n)
-            finally:
-                _sys.setrecursionlimit(_old_limit)
-            return out
-
-        sccs_found = _find_sccs(remaining_deps)
+        sccs_found = find_strongly_connected_components(remaining_deps)
         dropped_edges = 0
         for scc in sccs_found:
             if len(scc) <= 1:
@@ -5,7 +5,7 @@ import argparse
 import sys
 from pathlib import Path
 
-from utils import parse_database_file, get_target_architecture
+from utils import parse_database_file, get_target_architecture, extract_dep_name
 
 
 def find_dependents(target_package, packages, check_depends=True, check_makedepends=True):
@@ -20,7 +20,7 @@ def find_dependents(target_package, packages, check_depends=True, check_makedepe
             all_deps.extend(pkg_data.get('makedepends', []))
         
         for dep in all_deps:
-            dep_name = dep.split('>=')[0].split('=')[0].split('<')[0].split('>')[0]
+            dep_name = extract_dep_name(dep)
             if dep_name == target_package:
                 dependents.add(pkg_data['basename'])
                 break
@@ -44,10 +44,10 @@ def find_dependencies(target_package, packages, check_depends=True, check_makede
     deps = set()
     if check_depends:
         for dep in pkg_data.get('depends', []):
-            deps.add(dep.split('>=')[0].split('=')[0].split('<')[0].split('>')[0])
+            deps.add(extract_dep_name(dep))
     if check_makedepends:
         for dep in pkg_data.get('makedepends', []):
-            deps.add(dep.split('>=')[0].split('=')[0].split('<')[0].split('>')[0])
+            deps.add(extract_dep_name(dep))
     
     return sorted(deps)
 
@@ -59,10 +59,7 @@ def find_rebuild_order(target_packages, packages, max_depth=None):
     for name, data in packages.items():
         provides_map[name] = name
         for p in data.get('provides', []):
-            provides_map[p.split('=')[0].split('>')[0].split('<')[0]] = name
-
-    def extract_dep(d):
-        return d.split('>=')[0].split('=')[0].split('<')[0].split('>')[0]
+            provides_map[extract_dep_name(p)] = name
 
     # Find all reverse deps recursively
     to_rebuild = set()
@@ -75,7 +72,7 @@ def find_rebuild_order(target_packages, packages, max_depth=None):
             basename = data['basename']
             if basename in to_rebuild:
                 continue
-            all_deps = [extract_dep(d) for d in data.get('depends', []) + data.get('makedepends', [])]
+            all_deps = [extract_dep_name(d) for d in data.get('depends', []) + data.get('makedepends', [])]
             # Resolve through provides
             for dep in all_deps:
                 resolved = provides_map.get(dep, dep)
@@ -95,7 +92,7 @@ def find_rebuild_order(target_packages, packages, max_depth=None):
         basename = data['basename']
         if basename not in to_rebuild:
             continue
-        all_deps = [extract_dep(d) for d in data.get('depends', []) + data.get('makedepends', [])]
+        all_deps = [extract_dep_name(d) for d in data.get('depends', []) + data.get('makedepends', [])]
         seen = set()
         for dep in all_deps:
             resolved = provides_map.get(dep, dep)
@@ -136,10 +133,7 @@ def load_packages():
     for db_file, repo_name in db_files:
         db_path = Path(db_file)
         if db_path.exists():
-            repo_packages = parse_database_file(db_path)
-            for pkg in repo_packages.values():
-                pkg['repo'] = repo_name
-            packages.update(repo_packages)
+            packages.update(parse_database_file(db_path, repo=repo_name))
         else:
             print(f"Warning: {db_file} not found", file=sys.stderr)
     
@@ -25,13 +25,14 @@ import json
 import os
 import argparse
 import fnmatch
+import itertools
 import sys
 import datetime
 import configparser
 import subprocess
 import re
 import shutil
-import tarfile
+import threading
 from pathlib import Path
 from packaging import version
 from utils import (
@@ -41,9 +42,16 @@ from utils import (
     PACKAGE_SKIP_FLAG, parse_pkgbuild_deps, parse_database_file, X86_64_MIRROR,
     PKGBUILDS_DIR, SEPARATOR_WIDTH, get_target_architecture,
     compare_bin_package_versions, find_missing_dependencies,
-    load_packages_with_any, config, load_packages_unified
+    load_packages_with_any, config, load_packages_unified, get_pkgbuild_version,
+    save_pkgbuild_deps_cache, find_strongly_connected_components,
+    extract_dep_name, build_target_provides
 )
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # ============================================================
 # Helper Functions
 # ============================================================
@@ -51,6 +59,21 @@ from utils import (
 BOOTSTRAP_PACKAGES = {'linux-api-headers', 'glibc', 'binutils', 'gcc'}
 SPLIT_PACKAGE_SUFFIXES = ['-headers', '-docs', '-devel', '-dev']
 
+# Toolchain packages whose updates call for a bootstrap build
+CRITICAL_TOOLCHAIN_PACKAGES = frozenset(('linux-api-headers', 'gcc', 'binutils'))
+_BANNER_RULE = '=' * SEPARATOR_WIDTH
+_TOOLCHAIN_WARNING_HEADER = (
+    f"\n{_BANNER_RULE}\n"
+    "⚠️  WARNING: Bootstrap toolchain packages are outdated!\n"
+    f"{_BANNER_RULE}\n"
+    "The following toolchain packages need updates:"
+)
+_TOOLCHAIN_WARNING_FOOTER = (
+    "\nConsider running a bootstrap build:\n"
+    "  ./build_packages.py --bootstrap-toolchain\n"
+    f"{_BANNER_RULE}"
+)
+
 # Global verbose/quiet flags (set by argument parser)
 verbose = False
 quiet = False
@@ -69,9 +92,9 @@ def is_bootstrap_package(pkg_name):
     """Check if package is bootstrap-only (excluded from normal builds)"""
     return pkg_name in BOOTSTRAP_PACKAGES
 
-def extract_dep_name(dep_str):
-    """Extract package name from dependency string like 'pkg>=1.0'"""
-    return dep_str.split('=')[0].split('>')[0].split('<')[0].strip()
+def iter_all_deps(pkg):
+    """Iterate over a package's depends, makedepends and checkdepends without building a list"""
+    return itertools.chain(pkg.get('depends', ()), pkg.get('makedepends', ()), pkg.get('checkdepends', ()))
 
 
 class CompiledBlacklist:
@@ -79,10 +102,10 @@ class CompiledBlacklist:
     Precompiled blacklist for fast matching.
 
     Partitions patterns into literal names (O(1) set lookup) and wildcard
-    patterns (fnmatch). With a typical all-literal blacklist this eliminates
-    millions of fnmatch calls.
+    patterns, which are translated once into a single alternation regex so
+    a lookup is one match call regardless of how many wildcards there are.
     """
-    __slots__ = ('literals', 'wildcards', '_match_cache')
+    __slots__ = ('literals', 'wildcards', '_wildcard_re', '_match_cache')
 
     def __init__(self, patterns):
         self.literals = set()
@@ -93,6 +116,8 @@ class CompiledBlacklist:
                 self.wildcards.append(p)
             else:
                 self.literals.add(p)
+        self._wildcard_re = (re.compile('|'.join(fnmatch.translate(p) for p in self.wildcards))
+                             if self.wildcards else None)
         self._match_cache = {}
 
     def __bool__(self):
@@ -103,36 +128,45 @@ class CompiledBlacklist:
         cached = self._match_cache.get(name)
         if cached is not None:
             return cached
-        if name in self.literals:
-            self._match_cache[name] = True
-            return True
-        for pat in self.wildcards:
-            if fnmatch.fnmatch(name, pat):
-                self._match_cache[name] = True
-                return True
-        self._match_cache[name] = False
-        return False
+        result = name in self.literals or (
+            self._wildcard_re is not None and self._wildcard_re.match(name) is not None)
+        self._match_cache[name] = result
+        return result
 
     def matching_pattern(self, name):
         """Return the first pattern that matches name, or None."""
         if name in self.literals:
             return name
+        if self._wildcard_re is None or not self._wildcard_re.match(name):
+            return None
+        # Only rescan individual patterns on a hit to report which one matched
         for pat in self.wildcards:
             if fnmatch.fnmatch(name, pat):
                 return pat
         return None
 
 
+class _BasenameGroup:
+    """x86_64 packages sharing a pkgbase, and the newest version among them."""
+    __slots__ = ('packages', 'version', 'pkg_data')
+
+    def __init__(self, pkg):
+        self.packages = []
+        self.version = pkg['version']
+        self.pkg_data = pkg
+
+
 def build_provides_map(x86_packages, target_packages, build_packages=None):
     """Build unified provides mapping: name -> basename"""
     provides = {}
-    for pkg_dict in [x86_packages, target_packages]:
+    add = provides.__setitem__
+    for pkg_dict in (x86_packages, target_packages):
         for pkg_name, pkg_data in pkg_dict.items():
             basename = pkg_data.get('basename', pkg_name)
-            provides[pkg_name] = basename
-            provides[basename] = basename
-            for provide in pkg_data.get('provides', []):
-                provides[extract_dep_name(provide)] = basename
+            add(pkg_name, basename)
+            add(basename, basename)
+            for provide in pkg_data.get('provides', ()):
+                add(provide.partition('=')[0], basename)
     
     # Add split package patterns for build list packages
     if build_packages:
@@ -218,15 +252,33 @@ def write_results(packages, args):
         info(f"\n[DRY RUN] Would write {len(packages)} packages to {output_file}")
         return
     
+    timestamp = datetime.datetime.now().isoformat()
     output_data = {
         "_command": " ".join(sys.argv),
-        "_timestamp": datetime.datetime.now().isoformat(),
+        "_timestamp": timestamp,
         "packages": json_packages
     }
-    with open(output_file, "w") as f:
-        json.dump(output_data, f, indent=2)
+    # orjson is optional; it serializes large package lists much faster
+    if orjson is not None:
+        output_file.write_bytes(orjson.dumps(output_data, option=orjson.OPT_INDENT_2))
+    else:
+        with open(output_file, "w") as f:
+            json.dump(output_data, f, indent=2)
     
 
+# Set once pkgctl/git have been verified to be installed
+_TOOLS_VERIFIED = False
+
+# Held while a PKGBUILD fetch worker prints a multi-line report, so reports
+# from concurrent workers don't interleave
+_OUTPUT_LOCK = threading.Lock()
+
+def _git(repo_dir, *args, check=True):
+    """Run a git command against repo_dir (via git -C) and capture its output"""
+    return subprocess.run(["git", "-C", str(repo_dir), *args],
+                          check=check, capture_output=True, text=True)
+
+
 def load_package_overrides():
     """Load package URL/branch overrides from package-overrides.json"""
     overrides_file = Path("package-overrides.json")
@@ -240,7 +292,45 @@ def load_package_overrides():
         print(f"ERROR: Failed to load package overrides from {overrides_file}: {e}")
         sys.exit(1)
 
-def fetch_pkgbuild_deps(packages_to_build, no_update=False, full_x86_packages=None, target_packages=None):
+def known_dep_names(packages, full_x86_packages=None, target_packages=None):
+    """
+    Collect every dependency name that resolves to something we know about.
+    
+    That is build list names/basenames, all x86_64 + target names, basenames
+    and provides (when both package sets are given), and common split package
+    names (linux -> linux-headers, linux-docs, ...), so dependencies can be
+    filtered with a single set lookup each.
+    """
+    basenames_in_build = {pkg.get('basename', pkg['name']) for pkg in packages}
+    valid_deps = {pkg['name'] for pkg in packages} | basenames_in_build
+    if full_x86_packages and target_packages:
+        for pkg_dict in [full_x86_packages, target_packages]:
+            valid_deps.update(pkg_dict)
+            for pkg_name, pkg_data in pkg_dict.items():
+                valid_deps.add(pkg_data.get('basename', pkg_name))
+                valid_deps.update(provide.partition('=')[0] for provide in pkg_data.get('provides', []))
+    valid_deps.update(basename + suffix for basename in basenames_in_build
+                      for suffix in SPLIT_PACKAGE_SUFFIXES)
+    return valid_deps
+
+def filter_build_order_deps(pkg, valid_deps):
+    """
+    Reduce a package's dependency lists to those relevant for build ordering.
+    
+    Filters the complete build_* lists (falling back to the plain lists) down
+    to dependencies in valid_deps, skipping self-dependencies.
+    """
+    name = pkg['name']
+    for dep_type in ('depends', 'makedepends', 'checkdepends'):
+        if dep_type in pkg:
+            filtered_deps = []
+            for dep in pkg.get(f'build_{dep_type}', pkg[dep_type]):
+                dep_name = extract_dep_name(dep)
+                if dep_name != name and dep_name in valid_deps:
+                    filtered_deps.append(dep)
+            pkg[dep_type] = filtered_deps
+
+def fetch_pkgbuild_deps(packages_to_build, no_update=False, full_x86_packages=None, target_packages=None, jobs=10):
     """
     Fetch PKGBUILDs for packages and extract complete dependency information.
     
@@ -254,6 +344,7 @@ def fetch_pkgbuild_deps(packages_to_build, no_update=False, full_x86_packages=No
     Args:
         packages_to_build: List of package dictionaries to process
         no_update: Skip git operations, use existing PKGBUILDs
+        jobs: Number of PKGBUILDs to fetch concurrently
         
     Returns:
         list: Updated package list with complete dependency information
@@ -261,18 +352,22 @@ def fetch_pkgbuild_deps(packages_to_build, no_update=False, full_x86_packages=No
     if not packages_to_build:
         return packages_to_build
         
-    # Check if required tools are available
-    from utils import safe_command_execution
-    
-    if not safe_command_execution(["pkgctl", "--version"], "pkgctl version check", 
-                                 capture_output=True, exit_on_error=False):
-        print("Error: pkgctl not found. Please install devtools package.")
-        sys.exit(1)
-    
-    if not safe_command_execution(["git", "--version"], "git version check", 
-                                 capture_output=True, exit_on_error=False):
-        print("Error: git not found. Please install git package.")
-        sys.exit(1)
+    # Check if required tools are available (only needed for git operations,
+    # and only once per process)
+    global _TOOLS_VERIFIED
+    if not no_update and not _TOOLS_VERIFIED:
+        from utils import safe_command_execution
+        
+        if not safe_command_execution(["pkgctl", "--version"], "pkgctl version check", 
+                                     capture_output=True, exit_on_error=False):
+            print("Error: pkgctl not found. Please install devtools package.")
+            sys.exit(1)
+        
+        if not safe_command_execution(["git", "--version"], "git version check", 
+                                     capture_output=True, exit_on_error=False):
+            print("Error: git not found. Please install git package.")
+            sys.exit(1)
+        _TOOLS_VERIFIED = True
     
     Path(PKGBUILDS_DIR).mkdir(exist_ok=True)
     
@@ -294,25 +389,13 @@ def fetch_pkgbuild_deps(packages_to_build, no_update=False, full_x86_packages=No
         pkgbuild_path = pkgbuild_directory / "PKGBUILD"
         
         # Check if PKGBUILD exists and get current version
-        current_version = None
-        if pkgbuild_path.exists():
-            try:
-                import shlex
-                temp_script = f"""#!/bin/bash
-cd {shlex.quote(str(pkgbuild_path.parent))}
-source PKGBUILD 2>/dev/null || exit 1
-fullver="$pkgver-$pkgrel"
-if [[ -n $epoch ]]; then
-    fullver="$epoch:$fullver"
-fi
-echo "$fullver"
-"""
-                result = subprocess.run(['bash', '-c', temp_script], 
-                                      capture_output=True, text=True, timeout=10)
-                if result.returncode == 0:
-                    current_version = result.stdout.strip()
-            except Exception:
-                pass  # If we can't read version, treat as if PKGBUILD doesn't exist
+        # If we can't read the version, treat as if PKGBUILD doesn't exist.
+        # The content is kept for dependency parsing unless git changes it below.
+        try:
+            pkgbuild_content = pkgbuild_path.read_bytes()
+        except OSError:
+            pkgbuild_content = None
+        current_version = get_pkgbuild_version(pkgbuild_path, pkgbuild_content) if pkgbuild_content is not None else None
         
         # Determine what action to take based on target version vs database version
         target_version = pkg['version']
@@ -326,9 +409,13 @@ echo "$fullver"
             try:
                 if pkg.get('use_aur', False):
                     info(f"[{i}/{total}] Processing {name} (fetching from AUR)...")
-                    result = subprocess.run(["git", "clone", f"https://aur.archlinux.org/{basename}.git", basename], 
-                                         cwd=PKGBUILDS_DIR, check=True, 
-                                         capture_output=True, text=True)
+                    # Blobless clone: full history for later tag checkouts and pulls,
+                    # but file contents are only fetched for checked-out commits
+                    # (servers without partial clone support send everything)
+                    subprocess.run(["git", "clone", "--filter=blob:none",
+                                    f"https://aur.archlinux.org/{basename}.git", basename], 
+                                   cwd=PKGBUILDS_DIR, check=True, 
+                                   capture_output=True, text=True)
                 else:
                     info(f"[{i}/{total}] Processing {name} (fetching {target_version})...")
                     # Check for package overrides
@@ -337,121 +424,106 @@ echo "$fullver"
                         clone_url = override['url']
                         default_branch = override.get('branch', 'main')
                         print(f"  Using override: {clone_url} (branch: {default_branch})")
-                        result = subprocess.run(["git", "clone", "-b", default_branch, clone_url, basename], 
-                                             cwd=PKGBUILDS_DIR, check=True, 
-                                             capture_output=True, text=True)
+                        subprocess.run(["git", "clone", "--filter=blob:none", "-b", default_branch,
+                                        clone_url, basename], 
+                                       cwd=PKGBUILDS_DIR, check=True, 
+                                       capture_output=True, text=True)
                     else:
                         # Use pkgctl repo clone with version switching
                         pkgctl_cmd = ["pkgctl", "repo", "clone"]
                         if not pkg.get('force_latest', False):
                             pkgctl_cmd.extend(["--switch", pkg['version']])
                         pkgctl_cmd.append(basename)
-                        result = subprocess.run(pkgctl_cmd, cwd=PKGBUILDS_DIR, check=True, 
-                                             capture_output=True, text=True)
+                        subprocess.run(pkgctl_cmd, cwd=PKGBUILDS_DIR, check=True, 
+                                       capture_output=True, text=True)
                         # pkgctl configure sets HTTPS for non-official packagers; force SSH
                         pkg_repo = Path(PKGBUILDS_DIR) / basename
                         if pkg_repo.exists():
-                            cur_url = subprocess.run(["git", "config", "remote.origin.url"],
-                                                    cwd=pkg_repo, capture_output=True, text=True).stdout.strip()
+                            cur_url = _git(pkg_repo, "config", "remote.origin.url", check=False).stdout.strip()
                             if cur_url.startswith("https://gitlab.archlinux.org/"):
                                 ssh_url = cur_url.replace("https://gitlab.archlinux.org/", "git@gitlab.archlinux.org:")
-                                subprocess.run(["git", "remote", "set-url", "origin", ssh_url],
-                                             cwd=pkg_repo, capture_output=True)
+                                _git(pkg_repo, "remote", "set-url", "origin", ssh_url, check=False)
                     
                     if not pkg.get('force_latest', False) and basename in overrides:
                         # For override packages, checkout the specified branch
                         override_branch = overrides[basename].get('branch', 'main')
                         try:
-                            subprocess.run(["git", "checkout", override_branch], 
-                                         cwd=f"pkgbuilds/{basename}", check=True, 
-                                         capture_output=True, text=True)
+                            _git(f"pkgbuilds/{basename}", "checkout", override_branch)
                         except subprocess.CalledProcessError:
                             print(f"Warning: Could not checkout branch {override_branch} for {basename}, using default")
             except subprocess.CalledProcessError as e:
                 error_msg = e.stderr.strip() if e.stderr else 'Unknown error'
-                print(f"ERROR: Failed to fetch PKGBUILD for {name} (basename: {basename}): {error_msg}")
-                print(f"  Working directory: {PKGBUILDS_DIR}")
-                print(f"  Return code: {e.returncode}")
-                if "Username for" in error_msg or "Authentication failed" in error_msg:
-                    print(f"  -> Package {basename} may not exist in official repositories or requires authentication")
+                with _OUTPUT_LOCK:
+                    print(f"ERROR: Failed to fetch PKGBUILD for {name} (basename: {basename}): {error_msg}")
+                    print(f"  Working directory: {PKGBUILDS_DIR}")
+                    print(f"  Return code: {e.returncode}")
+                    if "Username for" in error_msg or "Authentication failed" in error_msg:
+                        print(f"  -> Package {basename} may not exist in official repositories or requires authentication")
                 return  # skip this package
         elif needs_update or pkg.get('force_latest', False):
             # Repository exists but needs update
+            pkgbuild_content = None
             pkg_repo_dir = Path("pkgbuilds") / basename
             try:
                 if pkg.get('force_latest', False):
                     info(f"[{i}/{total}] Processing {name} (updating to latest commit)...")
                     # Stash changes, checkout main, pull, then restore
-                    stash_result = subprocess.run(["git", "stash"], cwd=pkg_repo_dir, check=True, capture_output=True, text=True)
+                    stash_result = _git(pkg_repo_dir, "stash")
                     has_changes = "No local changes to save" not in stash_result.stdout
                     
                     # Get the default branch dynamically or use override
                     if basename in overrides:
                         default_branch = overrides[basename].get('branch', 'main')
                     else:
-                        default_branch_result = subprocess.run(["git", "symbolic-ref", "refs/remotes/origin/HEAD"], 
-                                                              cwd=pkg_repo_dir, capture_output=True, text=True)
+                        default_branch_result = _git(pkg_repo_dir, "symbolic-ref", "refs/remotes/origin/HEAD", check=False)
                         if default_branch_result.returncode == 0:
                             default_branch = default_branch_result.stdout.strip().split('/')[-1]
                         else:
                             # Fallback: get current branch
-                            current_branch_result = subprocess.run(["git", "branch", "--show-current"], 
-                                                                 cwd=pkg_repo_dir, capture_output=True, text=True)
+                            current_branch_result = _git(pkg_repo_dir, "branch", "--show-current", check=False)
                             default_branch = current_branch_result.stdout.strip() or "main"
                     
-                    subprocess.run(["git", "checkout", default_branch], cwd=pkg_repo_dir, check=True, capture_output=True)
+                    _git(pkg_repo_dir, "checkout", default_branch)
                     if basename in overrides:
-                        subprocess.run(["git", "fetch", "origin"], cwd=pkg_repo_dir, check=True, capture_output=True)
-                        subprocess.run(["git", "reset", "--hard", f"origin/{default_branch}"], cwd=pkg_repo_dir, check=True, capture_output=True)
+                        _git(pkg_repo_dir, "fetch", "origin")
+                        _git(pkg_repo_dir, "reset", "--hard", f"origin/{default_branch}")
                     else:
-                        subprocess.run(["git", "pull"], cwd=pkg_repo_dir, check=True, capture_output=True)
+                        _git(pkg_repo_dir, "pull")
                     
                     if has_changes:
                         try:
-                            subprocess.run(["git", "stash", "pop"], cwd=pkg_repo_dir, check=True, capture_output=True, text=True)
+                            _git(pkg_repo_dir, "stash", "pop")
                         except subprocess.CalledProcessError as e:
-                            print(f"ERROR: Failed to restore stashed changes for {basename}")
-                            if e.stderr:
-                                print(f"Git error: {e.stderr.strip()}")
-                            # Check for merge conflicts
-                            status_result = subprocess.run(["git", "status", "--porcelain"], cwd=pkg_repo_dir, capture_output=True, text=True)
-                            if status_result.stdout:
-                                print("Git status shows conflicts:")
-                                for line in status_result.stdout.strip().split('\n'):
-                                    if line.startswith('UU') or line.startswith('AA') or line.startswith('DD'):
-                                        print(f"  Conflict: {line}")
-                                    elif line.strip():
-                                        print(f"  {line}")
-                            print(f"Please resolve conflicts in pkgbuilds/{basename} and run again.")
+                            with _OUTPUT_LOCK:
+                                print(f"ERROR: Failed to restore stashed changes for {basename}")
+                                if e.stderr:
+                                    print(f"Git error: {e.stderr.strip()}")
+                                # Check for merge conflicts
+                                status_result = _git(pkg_repo_dir, "status", "--porcelain", check=False)
+                                if status_result.stdout:
+                                    print("Git status shows conflicts:")
+                                    for line in status_result.stdout.strip().split('\n'):
+                                        if line.startswith('UU') or line.startswith('AA') or line.startswith('DD'):
+                                            print(f"  Conflict: {line}")
+                                        elif line.strip():
+                                            print(f"  {line}")
+                                print(f"Please resolve conflicts in pkgbuilds/{basename} and run again.")
                             sys.exit(1)
                     
                     # Re-read version after git pull for --use-latest
-                    try:
-                        import shlex
-                        temp_script = f"""#!/bin/bash
-cd {shlex.quote(str(pkgbuild_path.parent))}
-source PKGBUILD 2>/dev/null || exit 1
-fullver="$pkgver-$pkgrel"
-if [[ -n $epoch ]]; then
-    fullver="$epoch:$fullver"
-fi
-echo "$fullver"
-"""
-                        result = subprocess.run(['bash', '-c', temp_script], 
-                                              capture_output=True, text=True, timeout=10)
-                        if result.returncode == 0:
-                            pkg['version'] = result.stdout.strip()
-                    except Exception:
-                        pass  # Keep original version if parsing fails
+                    # (keep original version if parsing fails)
+                    latest_version = get_pkgbuild_version(pkgbuild_path)
+                    if latest_version:
+                        pkg['version'] = latest_version
                 else:
                     if current_version:
                         info(f"[{i}/{total}] Processing {name} (updating {current_version} -> {target_version})...")
                     else:
                         info(f"[{i}/{total}] Processing {name} (updating to {target_version})...")
-                    subprocess.run(["git", "fetch", "--tags"], cwd=pkg_repo_dir, check=True, capture_output=True)
+                    _git(pkg_repo_dir, "fetch", "--tags")
                     
                     # Stash changes before checkout
-                    stash_result = subprocess.run(["git", "stash"], cwd=pkg_repo_dir, check=True, capture_output=True, text=True)
+                    stash_result = _git(pkg_repo_dir, "stash")
                     has_changes = "No local changes to save" not in stash_result.stdout
                     
                     # Try different tag formats - replace : with - for git tags
@@ -459,67 +531,75 @@ echo "$fullver"
                         # For override packages, just checkout the specified branch
                         override_branch = overrides[basename].get('branch', 'main')
                         try:
-                            subprocess.run(["git", "fetch", "origin"], cwd=pkg_repo_dir, check=True, capture_output=True, text=True)
-                            subprocess.run(["git", "reset", "--hard", f"origin/{override_branch}"], cwd=pkg_repo_dir, check=True, capture_output=True, text=True)
+                            # Remote branches were already updated by fetch --tags above
+                            _git(pkg_repo_dir, "reset", "--hard", f"origin/{override_branch}")
                         except subprocess.CalledProcessError as checkout_error:
                             # Try rebase before giving up
                             print(f"  Git update failed for override package {basename}, trying rebase...")
                             try:
-                                subprocess.run(["git", "rebase", f"origin/{override_branch}"], cwd=pkg_repo_dir, check=True, capture_output=True, text=True)
+                                _git(pkg_repo_dir, "rebase", f"origin/{override_branch}")
                                 print(f"  Rebased {basename} onto origin/{override_branch}")
                             except subprocess.CalledProcessError:
-                                subprocess.run(["git", "rebase", "--abort"], cwd=pkg_repo_dir, capture_output=True)
-                                print(f"ERROR: Failed to update override package {basename}")
-                                print(f"  Please resolve manually in pkgbuilds/{basename} and run again.")
+                                _git(pkg_repo_dir, "rebase", "--abort", check=False)
+                                with _OUTPUT_LOCK:
+                                    print(f"ERROR: Failed to update override package {basename}")
+                                    print(f"  Please resolve manually in pkgbuilds/{basename} and run again.")
                                 sys.exit(1)
                     else:
                         git_version_tag = target_version.replace(':', '-')
-                        tag_formats = list(set([git_version_tag, target_version, f"v{git_version_tag}", f"{basename}-{git_version_tag}"]))
+                        tag_formats = list(dict.fromkeys([git_version_tag, target_version, f"v{git_version_tag}", f"{basename}-{git_version_tag}"]))
+                        # Tags are local after fetch --tags: list which candidates exist
+                        # in one call, then check out the first one that succeeds
+                        existing_tags = set(_git(pkg_repo_dir, "tag", "--list", *tag_formats, check=False).stdout.split())
                         checkout_success = False
                         for tag_format in tag_formats:
+                            if tag_format not in existing_tags:
+                                continue
                             try:
-                                result = subprocess.run(["git", "checkout", tag_format], cwd=pkg_repo_dir, check=True, capture_output=True, text=True)
+                                _git(pkg_repo_dir, "checkout", tag_format)
                                 checkout_success = True
                                 break
-                            except subprocess.CalledProcessError as checkout_error:
+                            except subprocess.CalledProcessError:
                                 continue
                         
                         if not checkout_success:
                             print(f"Warning: Could not find tag for {basename} version {target_version}, using latest commit")
                             try:
-                                # Reset to clean state before updating to latest
-                                subprocess.run(["git", "reset", "--hard"], cwd=pkg_repo_dir, check=True, capture_output=True)
-                                subprocess.run(["git", "fetch", "origin"], cwd=pkg_repo_dir, check=True, capture_output=True, text=True)
-                                subprocess.run(["git", "reset", "--hard", "origin/main"], cwd=pkg_repo_dir, check=True, capture_output=True, text=True)
+                                # origin/main is current after fetch --tags; a hard reset
+                                # also discards any partial checkout state
+                                _git(pkg_repo_dir, "reset", "--hard", "origin/main")
                             except subprocess.CalledProcessError as pull_error:
-                                print(f"Warning: Failed to pull latest commit for {basename}: {pull_error}")
-                                if pull_error.stderr:
-                                    print(f"Git error: {pull_error.stderr.strip()}")
+                                with _OUTPUT_LOCK:
+                                    print(f"Warning: Failed to pull latest commit for {basename}: {pull_error}")
+                                    if pull_error.stderr:
+                                        print(f"Git error: {pull_error.stderr.strip()}")
                     
                     # Restore stashed changes
                     if has_changes:
                         try:
-                            subprocess.run(["git", "stash", "pop"], cwd=pkg_repo_dir, check=True, capture_output=True, text=True)
+                            _git(pkg_repo_dir, "stash", "pop")
                         except subprocess.CalledProcessError as e:
-                            print(f"ERROR: Failed to restore stashed changes for {basename}")
-                            if e.stderr:
-                                print(f"Git error: {e.stderr.strip()}")
-                            # Check for merge conflicts
-                            status_result = subprocess.run(["git", "status", "--porcelain"], cwd=pkg_repo_dir, capture_output=True, text=True)
-                            if status_result.stdout:
-                                print("Git status shows conflicts:")
-                                for line in status_result.stdout.strip().split('\n'):
-                                    if line.startswith('UU') or line.startswith('AA') or line.startswith('DD'):
-                                        print(f"  Conflict: {line}")
-                                    elif line.strip():
-                                        print(f"  {line}")
-                            print(f"Please resolve conflicts in pkgbuilds/{basename} and run again.")
+                            with _OUTPUT_LOCK:
+                                print(f"ERROR: Failed to restore stashed changes for {basename}")
+                                if e.stderr:
+                                    print(f"Git error: {e.stderr.strip()}")
+                                # Check for merge conflicts
+                                status_result = _git(pkg_repo_dir, "status", "--porcelain", check=False)
+                                if status_result.stdout:
+                                    print("Git status shows conflicts:")
+                                    for line in status_result.stdout.strip().split('\n'):
+                                        if line.startswith('UU') or line.startswith('AA') or line.startswith('DD'):
+                                            print(f"  Conflict: {line}")
+                                        elif line.strip():
+                                            print(f"  {line}")
+                                print(f"Please resolve conflicts in pkgbuilds/{basename} and run again.")
                             sys.exit(1)
             except subprocess.CalledProcessError as e:
-                print(f"ERROR: Failed to update {basename}: {e}")
-                if hasattr(e, 'stderr') and e.stderr:
-                    print(f"Git error: {e.stderr.strip()}")
-                print(f"Please resolve git conflicts in pkgbuilds/{basename} and run again.")
+                with _OUTPUT_LOCK:
+                    print(f"ERROR: Failed to update {basename}: {e}")
+                    if hasattr(e, 'stderr') and e.stderr:
+                        print(f"Git error: {e.stderr.strip()}")
+                    print(f"Please resolve git conflicts in pkgbuilds/{basename} and run again.")
                 sys.exit(1)
         else:
             # Repository exists and is up to date
@@ -527,7 +607,7 @@ echo "$fullver"
         
         # Parse dependencies from existing PKGBUILD (skip provides - use database)
         if pkgbuild_path.exists():
-            deps = parse_pkgbuild_deps(pkgbuild_path)
+            deps = parse_pkgbuild_deps(pkgbuild_path, content=pkgbuild_content)
             # Keep original provides from database, only update dependencies
             original_provides = pkg.get('provides', [])
             pkg.update(deps)
@@ -535,9 +615,9 @@ echo "$fullver"
         else:
             print(f"  PKGBUILD does not exist for {pkg['name']} at {pkgbuild_path}")
     
-    # Fetch PKGBUILDs in parallel (10 at a time)
+    # Fetch PKGBUILDs in parallel (jobs at a time)
     from concurrent.futures import ThreadPoolExecutor, as_completed
-    with ThreadPoolExecutor(max_workers=10) as executor:
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
         futures = {executor.submit(_fetch_one, (i, pkg)): pkg 
                    for i, pkg in enumerate(packages_to_fetch, 1)}
         for future in as_completed(futures):
@@ -552,36 +632,12 @@ echo "$fullver"
                 for f in futures:
                     f.cancel()
                 raise
+    save_pkgbuild_deps_cache()
     
     # Return combined list with blacklisted packages (unchanged) and fetched packages (with updated deps)
     all_packages = packages_to_fetch + blacklisted_packages
     
-    # Create build list for dependency ordering (filtered dependencies)
-    build_list_names = {pkg['name'] for pkg in all_packages}
-    build_list_basenames = {pkg.get('basename', pkg['name']) for pkg in all_packages}
-    
-    # Build provides mapping from ALL packages (x86_64 + target)
-    build_list_provides = {}
-    if full_x86_packages and target_packages:
-        for pkg_dict in [full_x86_packages, target_packages]:
-            for pkg_name, pkg_data in pkg_dict.items():
-                basename = pkg_data.get('basename', pkg_name)
-                build_list_provides[pkg_name] = basename
-                build_list_provides[basename] = basename
-                for provide in pkg_data.get('provides', []):
-                    provide_name = provide.split('=')[0]
-                    build_list_provides[provide_name] = basename
-        
-    
-    # Add common split package patterns for packages in build list
-    # This handles cases like linux providing linux-headers, linux-docs, etc.
-    basenames_in_build = {pkg.get('basename', pkg['name']) for pkg in all_packages}
-    for basename in basenames_in_build:
-        # Common split package suffixes
-        for suffix in ['-headers', '-docs', '-devel', '-dev']:
-            split_name = basename + suffix
-            if split_name not in build_list_provides:
-                build_list_provides[split_name] = basename
+    valid_deps = known_dep_names(all_packages, full_x86_packages, target_packages)
     
     for pkg in all_packages:
         # Keep original dependencies for build system
@@ -590,20 +646,7 @@ echo "$fullver"
         pkg['build_checkdepends'] = pkg.get('checkdepends', []).copy()
         
         # Filter dependencies for build ordering only
-        for dep_type in ['depends', 'makedepends', 'checkdepends']:
-            if dep_type in pkg:
-                filtered_deps = []
-                for dep in pkg[dep_type]:
-                    dep_name = extract_dep_name(dep)
-                    # Skip self-dependencies
-                    if dep_name == pkg['name']:
-                        continue
-                    if (dep_name in build_list_names or 
-                        dep_name in build_list_basenames or
-                        dep_name in build_list_provides):
-                        filtered_deps.append(dep)
-                pkg[dep_type] = filtered_deps
-    
+        filter_build_order_deps(pkg, valid_deps)    
     
     return all_packages
 
@@ -614,7 +657,8 @@ echo "$fullver"
 
 
 
-def compare_versions(x86_packages, target_packages, force_packages=None, blacklist=None, aur_packages=None, use_latest=False, full_x86_packages=None):
+def compare_versions(x86_packages, target_packages, force_packages=None, blacklist=None, aur_packages=None, use_latest=False, full_x86_packages=None,
+                     target_provides=None):
     """
     Compare package versions between x86_64 and target architecture repositories.
     
@@ -625,18 +669,24 @@ def compare_versions(x86_packages, target_packages, force_packages=None, blackli
         blacklist: List of blacklist patterns
         aur_packages: Set of packages to get from AUR
         use_latest: Use latest git commits instead of version tags
+        full_x86_packages: All x86_64 packages, for blacklisted dependency lookups
+        target_provides: build_target_provides() map for target_packages, if
+            the caller already has one
         
     Returns:
-        tuple: (packages_to_build, skipped_packages, bin_package_warnings)
+        tuple: (packages_to_build, skipped_packages, bin_package_warnings), where
+        skipped_packages is a list of (basename, reason) tuples
     """
-    force_packages = set(force_packages or [])
-    aur_packages = set(aur_packages or [])
-    # Precompile blacklist once: splits literals (O(1) set) from wildcards (fnmatch)
+    force_packages = frozenset(force_packages or ())
+    aur_packages = frozenset(aur_packages or ())
+    # Precompile blacklist once: literals go in a set, wildcards in one regex
+    # alternation (fnmatch only runs on a hit, to name the matching pattern)
     bl = blacklist if isinstance(blacklist, CompiledBlacklist) else CompiledBlacklist(blacklist or [])
     
     skipped_packages = []
     
-    # Group packages by basename
+    # Group packages by basename: basename -> _BasenameGroup for x86_64,
+    # basename -> newest version for the target architecture
     x86_bases = {}
     target_bases = {}
     
@@ -644,29 +694,27 @@ def compare_versions(x86_packages, target_packages, force_packages=None, blackli
     # Group packages by basename and build provides mapping
     # ============================================================
     
-    # Build provides mapping for target architecture packages
-    target_provides = {name: pkg for name, pkg in target_packages.items()}
-    for pkg in target_packages.values():
-        for provide in pkg['provides']:
-            provide_name = provide.split('=')[0]
-            target_provides[provide_name] = pkg
+    # Provides mapping for target architecture packages
+    if target_provides is None:
+        target_provides = build_target_provides(target_packages)
     
     # Group x86_64 packages by basename
+    # Single dict lookup per package; only allocate an entry for a new basename
     for name, pkg in x86_packages.items():
         basename = pkg['basename']
-        if basename not in x86_bases:
-            x86_bases[basename] = {'packages': [], 'version': pkg['version'], 'pkg_data': pkg}
-        elif is_version_newer(x86_bases[basename]['version'], pkg['version']):
-            x86_bases[basename]['version'] = pkg['version']
-            x86_bases[basename]['pkg_data'] = pkg
-        x86_bases[basename]['packages'].append(name)
-    
-    for name, pkg in target_packages.items():
+        entry = x86_bases.get(basename)
+        if entry is None:
+            entry = x86_bases[basename] = _BasenameGroup(pkg)
+        elif is_version_newer(entry.version, pkg['version']):
+            entry.version = pkg['version']
+            entry.pkg_data = pkg
+        entry.packages.append(name)
+    
+    for pkg in target_packages.values():
         basename = pkg['basename']
-        if basename not in target_bases:
-            target_bases[basename] = {'version': pkg['version']}
-        elif is_version_newer(target_bases[basename]['version'], pkg['version']):
-            target_bases[basename] = {'version': pkg['version']}
+        current = target_bases.get(basename)
+        if current is None or is_version_newer(current, pkg['version']):
+            target_bases[basename] = pkg['version']
     
     newer_in_x86 = []
     bin_package_warnings = []
@@ -679,34 +727,31 @@ def compare_versions(x86_packages, target_packages, force_packages=None, blackli
             if pat:
                 blacklist_reason = f"basename '{basename}' matches pattern '{pat}'"
             else:
-                for pkg_name in x86_data['packages']:
+                for pkg_name in x86_data.packages:
                     pat = bl.matching_pattern(pkg_name)
                     if pat:
                         blacklist_reason = f"package '{pkg_name}' matches pattern '{pat}'"
                         break
         
         if blacklist_reason:
-            skipped_packages.append(f"{basename} ({blacklist_reason})")
+            skipped_packages.append((basename, blacklist_reason))
             # Only add blacklisted packages to output if explicitly requested
             if force_packages and basename in force_packages:
-                newer_in_x86.append({
+                # Base the entry on the newest package's data (x86_data itself
+                # is the basename grouping, not a package)
+                newer_in_x86.append(x86_data.pkg_data | {
                     'name': basename,
                     'force_latest': use_latest,
                     'use_aur': basename in aur_packages,
                     'skip': 1,
-                    'depends': x86_data.get('depends', []),
-                    'makedepends': x86_data.get('makedepends', []),
-                    'provides': x86_data.get('provides', []),
-                    **x86_data
                 })
             continue
         
         # Check if package depends on blacklisted packages
         if bl and not force_packages:
-            pkg_data = x86_data['pkg_data']
-            all_deps = pkg_data.get('depends', []) + pkg_data.get('makedepends', [])
+            pkg_data = x86_data.pkg_data
             blacklisted_dep = None
-            for dep in all_deps:
+            for dep in itertools.chain(pkg_data.get('depends', ()), pkg_data.get('makedepends', ())):
                 dep_name = extract_dep_name(dep)
                 # Check dep name and its pkgbase against blacklist
                 if bl.matches(dep_name):
@@ -718,47 +763,50 @@ def compare_versions(x86_packages, target_packages, force_packages=None, blackli
                         blacklisted_dep = dep_name
                         break
             if blacklisted_dep:
-                skipped_packages.append(f"{basename} (depends on blacklisted package: {blacklisted_dep})")
+                skipped_packages.append((basename, f"depends on blacklisted package: {blacklisted_dep}"))
                 continue
         
+        # Look up the target version once; None if the basename is not built yet
+        current_target_version = target_bases.get(basename)
+        
         # Skip bootstrap-only packages unless explicitly forced
         if is_bootstrap_package(basename) and not force_packages:
-            has_newer_version = (basename not in target_bases or 
-                               is_version_newer(target_bases[basename]['version'], x86_data['version']))
+            has_newer_version = (current_target_version is None or 
+                               is_version_newer(current_target_version, x86_data.version))
             
             if has_newer_version:
-                skipped_packages.append(f"{basename} (bootstrap-only package - newer version available, run bootstrap script)")
+                skipped_packages.append((basename, "bootstrap-only package - newer version available, run bootstrap script"))
             continue
             
         if force_packages:
             # When --packages is specified, check if any individual package name is requested
-            should_include = (basename in force_packages or 
-                            any(pkg_name in force_packages for pkg_name in x86_data['packages']))
-            if basename in target_bases:
-                target_version = target_bases[basename]['version']
+            should_include = (basename in force_packages or
+                              not force_packages.isdisjoint(x86_data.packages))
+            if current_target_version is not None:
+                target_version = current_target_version
             elif basename in target_provides and target_provides[basename]['name'].endswith('-bin'):
                 # Check if a -bin package provides this package
                 bin_pkg = target_provides[basename]
                 provided_version = None
                 for provide in bin_pkg['provides']:
                     if provide.startswith(f"{basename}="):
-                        provided_version = provide.split('=')[1]
+                        provided_version = provide.partition('=')[2]
                         break
                 
                 if provided_version:
-                    comparison = compare_bin_package_versions(provided_version, x86_data['version'])
+                    comparison = compare_bin_package_versions(provided_version, x86_data.version)
                     if comparison == -1:
-                        bin_package_warnings.append(f"WARNING: {bin_pkg['name']} (provides {basename}={provided_version}) is outdated compared to x86_64 {basename} ({x86_data['version']})")
+                        bin_package_warnings.append(f"WARNING: {bin_pkg['name']} (provides {basename}={provided_version}) is outdated compared to x86_64 {basename} ({x86_data.version})")
                     elif comparison == 1:
-                        bin_package_warnings.append(f"INFO: {bin_pkg['name']} (provides {basename}={provided_version}) is newer than x86_64 {basename} ({x86_data['version']})")
+                        bin_package_warnings.append(f"INFO: {bin_pkg['name']} (provides {basename}={provided_version}) is newer than x86_64 {basename} ({x86_data.version})")
                 # For --packages mode, still include the package even if -bin exists
                 target_version = f"provided by {bin_pkg['name']}"
             else:
                 target_version = "not found"
-        elif basename in target_bases:
+        elif current_target_version is not None:
             # Compare basename versions using existing utility
-            should_include = is_version_newer(target_bases[basename]['version'], x86_data['version'])
-            target_version = target_bases[basename]['version']
+            should_include = is_version_newer(current_target_version, x86_data.version)
+            target_version = current_target_version
         else:
             # Check if a -bin package provides this package
             if basename in target_provides and target_provides[basename]['name'].endswith('-bin'):
@@ -767,15 +815,15 @@ def compare_versions(x86_packages, target_packages, force_packages=None, blackli
                 provided_version = None
                 for provide in bin_pkg['provides']:
                     if provide.startswith(f"{basename}="):
-                        provided_version = provide.split('=')[1]
+                        provided_version = provide.partition('=')[2]
                         break
                 
                 if provided_version:
-                    comparison = compare_bin_package_versions(provided_version, x86_data['version'])
+                    comparison = compare_bin_package_versions(provided_version, x86_data.version)
                     if comparison == -1:
-                        bin_package_warnings.append(f"WARNING: {bin_pkg['name']} (provides {basename}={provided_version}) is outdated compared to x86_64 {basename} ({x86_data['version']})")
+                        bin_package_warnings.append(f"WARNING: {bin_pkg['name']} (provides {basename}={provided_version}) is outdated compared to x86_64 {basename} ({x86_data.version})")
                     elif comparison == 1:
-                        bin_package_warnings.append(f"INFO: {bin_pkg['name']} (provides {basename}={provided_version}) is newer than x86_64 {basename} ({x86_data['version']})")
+                        bin_package_warnings.append(f"INFO: {bin_pkg['name']} (provides {basename}={provided_version}) is newer than x86_64 {basename} ({x86_data.version})")
                 should_include = False
                 target_version = f"provided by {bin_pkg['name']}"
             else:
@@ -790,7 +838,7 @@ def compare_versions(x86_packages, target_packages, force_packages=None, blackli
                 if bl.matches(basename):
                     is_blacklisted = True
                 else:
-                    for pkg_name in x86_data['packages']:
+                    for pkg_name in x86_data.packages:
                         if bl.matches(pkg_name):
                             is_blacklisted = True
                             break
@@ -798,9 +846,6 @@ def compare_versions(x86_packages, target_packages, force_packages=None, blackli
             if is_blacklisted:
                 continue  # Skip blacklisted packages
                 
-            pkg_data = x86_data['pkg_data'].copy()
-            pkg_data['name'] = basename
-            
             # When using --packages, default to state repo version unless --use-latest is specified
             should_use_latest = False if force_packages else use_latest
             if force_packages and use_latest:
@@ -808,13 +853,13 @@ def compare_versions(x86_packages, target_packages, force_packages=None, blackli
             
             newer_in_x86.append({
                 'name': basename,
-                'version': x86_data['version'],
+                'version': x86_data.version,
                 'current_version': target_version,
-                'basename': x86_data['pkg_data']['basename'],
-                'repo': x86_data['pkg_data']['repo'],
-                'depends': x86_data['pkg_data'].get('depends', []),
-                'makedepends': x86_data['pkg_data'].get('makedepends', []),
-                'provides': x86_data['pkg_data'].get('provides', []),
+                'basename': x86_data.pkg_data['basename'],
+                'repo': x86_data.pkg_data['repo'],
+                'depends': x86_data.pkg_data.get('depends', []),
+                'makedepends': x86_data.pkg_data.get('makedepends', []),
+                'provides': x86_data.pkg_data.get('provides', []),
                 'force_latest': should_use_latest,
                 'use_aur': bool(basename in aur_packages),
             })
@@ -832,104 +877,78 @@ def preserve_package_order(packages, ordered_names):
     Returns:
         list: Packages sorted in specified order with build_stage assigned sequentially
     """
-    # Create lookup map
+    # Create lookup map; dict.fromkeys gives an ordered set of requested names
     pkg_map = {pkg['name']: pkg for pkg in packages}
+    requested = dict.fromkeys(ordered_names)
     
-    # Sort packages in specified order
+    # Place packages in specified order (build_stage is set in place; this is
+    # the final ordering step so the dicts are not copied)
     ordered_packages = []
-    for i, name in enumerate(ordered_names):
-        if name in pkg_map:
-            pkg = pkg_map[name].copy()
+    for i, name in enumerate(requested):
+        pkg = pkg_map.get(name)
+        if pkg is not None:
             pkg['build_stage'] = i
             ordered_packages.append(pkg)
     
-    # Add any remaining packages not in the ordered list
-    remaining_names = set(pkg_map.keys()) - set(ordered_names)
-    for i, name in enumerate(sorted(remaining_names)):
-        pkg = pkg_map[name].copy()
-        pkg['build_stage'] = len(ordered_names) + i
-        ordered_packages.append(pkg)
+    # Add any remaining packages not in the ordered list, in input order
+    stage = len(requested)
+    for pkg in packages:
+        if pkg['name'] not in requested:
+            pkg['build_stage'] = stage
+            stage += 1
+            ordered_packages.append(pkg)
     
     return ordered_packages
 
-def find_strongly_connected_components(graph):
-    """
-    Find strongly connected components using Tarjan's algorithm.
-    Returns list of SCCs, each SCC is a list of nodes.
+def _topological_levels(names, successors, in_degree):
     """
-    index_counter = [0]
-    stack = []
-    lowlinks = {}
-    index = {}
-    on_stack = {}
-    sccs = []
-    
-    def strongconnect(node):
-        index[node] = index_counter[0]
-        lowlinks[node] = index_counter[0]
-        index_counter[0] += 1
-        stack.append(node)
-        on_stack[node] = True
-        
-        for successor in graph.get(node, []):
-            if successor not in index:
-                strongconnect(successor)
-                lowlinks[node] = min(lowlinks[node], lowlinks[successor])
-            elif on_stack.get(successor, False):
-                lowlinks[node] = min(lowlinks[node], index[successor])
-        
-        if lowlinks[node] == index[node]:
-            component = []
-            while True:
-                w = stack.pop()
-                on_stack[w] = False
-                component.append(w)
-                if w == node:
-                    break
-            sccs.append(component)
+    Group nodes into build levels with Kahn's algorithm.
     
-    for node in graph:
-        if node not in index:
-            strongconnect(node)
+    Each level holds the nodes whose dependencies were all placed in earlier
+    levels; nodes left in a cycle never reach in-degree zero and are omitted.
     
-    return sccs
+    Args:
+        names: Nodes in input order (seeds the first level)
+        successors: Mapping of node -> nodes that depend on it
+        in_degree: Mapping of node -> number of dependencies (consumed)
+        
+    Returns:
+        list: One list of node names per level, in build order
+    """
+    levels = []
+    frontier = [name for name in names if in_degree[name] == 0]
+    while frontier:
+        levels.append(frontier)
+        next_frontier = []
+        for name in frontier:
+            for dependent in successors.get(name, ()):
+                in_degree[dependent] -= 1
+                if in_degree[dependent] == 0:
+                    next_frontier.append(dependent)
+        frontier = next_frontier
+    return levels
 
 def sort_by_build_order(packages, all_x86_packages=None, all_target_packages=None):
     """
     Sort packages by dependency order using topological sort with proper cycle detection.
+    
+    Packages built once get their build_stage/cycle fields set in place and
+    are returned as the same dicts; only packages in a cycle are copied,
+    since they appear twice (stage 1 and stage 2).
     """
-    from collections import defaultdict, deque
+    from collections import defaultdict
     
     # Create package name to package mapping
     pkg_map = {pkg['name']: pkg for pkg in packages}
     
-    # Build provides mapping from ALL packages (x86_64 + target) for dependency resolution
-    all_provides = {}
+    # Build provides mapping from ALL packages (x86_64 + target) for dependency
+    # resolution, plus common split package names for packages in the build list
+    # (linux -> linux-headers, linux-docs, etc.)
     if all_x86_packages and all_target_packages:
-        for pkg_dict in [all_x86_packages, all_target_packages]:
-            for pkg_name, pkg_data in pkg_dict.items():
-                basename = pkg_data.get('basename', pkg_name)
-                all_provides[pkg_name] = basename  # Map package name to basename
-                all_provides[basename] = basename
-                for provide in pkg_data.get('provides', []):
-                    provide_name = provide.split('=')[0].strip()
-                    all_provides[provide_name] = basename  # Map provides to basename
-    
-    # Add common split package patterns for packages in build list
-    # This handles cases like linux providing linux-headers, linux-docs, etc.
-    basenames_in_build = {pkg.get('basename', pkg['name']) for pkg in packages}
-    for basename in basenames_in_build:
-        # Common split package suffixes
-        for suffix in ['-headers', '-docs', '-devel', '-dev']:
-            split_name = basename + suffix
-            if split_name not in all_provides:
-                all_provides[split_name] = basename
-    
-    # Build dependency graph - only consider packages in our build list
-    graph = defaultdict(set)  # pkg -> set of packages that depend on it
-    reverse_graph = defaultdict(set)  # pkg -> set of packages it depends on
-    in_degree = defaultdict(int)  # pkg -> number of dependencies
-
+        all_provides = build_provides_map(all_x86_packages, all_target_packages, packages)
+    else:
+        all_provides = build_provides_map({}, {}, packages)
+    
     # Separate runtime-only reverse graph for SCC detection.
     # Cycles through checkdepends alone do NOT require two-stage rebuild
     # (they only affect check() during test runs, which can use whatever
@@ -937,7 +956,6 @@ def sort_by_build_order(packages, all_x86_packages=None, all_target_packages=Non
     # runtime cycles that need stage 1 + stage 2.
     runtime_reverse_graph = defaultdict(set)
 
-    # Initialize in_degree for all packages
     # Identify GHC-compiled (Haskell) packages. These cannot participate in
     # two-stage cycles because GHC embeds per-compile ABI hashes in each .so/.hi,
     # so stage-2 rebuilds produce outputs inconsistent with what they were linked
@@ -952,10 +970,30 @@ def sort_by_build_order(packages, all_x86_packages=None, all_target_packages=Non
                 return True
         return False
 
+    # Resolve each dependency to the build-list package that provides it, once
+    # per package and dependency type; names in the build list resolve to
+    # themselves ahead of any provides entry. Self-dependencies and dependencies
+    # outside the build list are dropped; the graph passes below share this table.
+    resolvable = {name: provider for name, provider in all_provides.items() if provider in pkg_map}
+    resolvable.update((name, name) for name in pkg_map)
+    dep_providers = {}
     for pkg in packages:
-        in_degree[pkg['name']] = 0
+        pkg_name = pkg['name']
+        by_type = {}
+        for dep_type in ('depends', 'makedepends', 'checkdepends'):
+            providers = []
+            for dep_str in pkg.get(dep_type, []):
+                provider_pkg = resolvable.get(extract_dep_name(dep_str))
+                if provider_pkg is not None and provider_pkg != pkg_name:
+                    providers.append(provider_pkg)
+            by_type[dep_type] = providers
+        dep_providers[pkg_name] = by_type
     
-    # Build the dependency graph
+    def _all_dep_providers(pkg_name):
+        by_type = dep_providers[pkg_name]
+        return by_type['depends'] + by_type['makedepends'] + by_type['checkdepends']
+    
+    # Build the runtime dependency graph
     for pkg in packages:
         pkg_name = pkg['name']
 
@@ -970,83 +1008,9 @@ def sort_by_build_order(packages, all_x86_packages=None, all_target_packages=Non
             runtime_dep_types = ('depends', 'makedepends')
         runtime_deps_resolved = set()
         for dep_type in runtime_dep_types:
-            for dep_str in pkg.get(dep_type, []):
-                dep_name = extract_dep_name(dep_str)
-                if dep_name == pkg_name:
-                    continue
-                provider_pkg = None
-                if dep_name in pkg_map:
-                    provider_pkg = dep_name
-                elif dep_name in all_provides:
-                    provider_pkg = all_provides[dep_name]
-                if provider_pkg and provider_pkg in pkg_map and provider_pkg != pkg_name:
-                    runtime_deps_resolved.add(provider_pkg)
+            runtime_deps_resolved.update(dep_providers[pkg_name][dep_type])
         for provider_pkg in runtime_deps_resolved:
             runtime_reverse_graph[pkg_name].add(provider_pkg)
-
-        # Collect all dependencies (including checkdepends) for the full graph
-        all_deps = []
-        for dep_type in ['depends', 'makedepends', 'checkdepends']:
-            all_deps.extend(pkg.get(dep_type, []))
-        
-        # Process each dependency (remove duplicates to avoid counting same dependency multiple times)
-        seen_deps = set()
-        for dep_str in all_deps:
-            # Extract package name (remove version constraints)
-            dep_name = extract_dep_name(dep_str)
-            if dep_name in seen_deps or dep_name == pkg_name:  # Skip duplicates and self-deps
-                continue
-            seen_deps.add(dep_name)
-            
-            # Resolve provides relationships
-            provider_pkg = None
-            if dep_name in pkg_map:
-                provider_pkg = dep_name
-            elif dep_name in all_provides:
-                provider_pkg = all_provides[dep_name]
-            
-            # Create edge if dependency provider is in our build list
-            if provider_pkg and provider_pkg in pkg_map and provider_pkg != pkg_name:
-                # provider_pkg must be built before pkg_name
-                graph[provider_pkg].add(pkg_name)
-                reverse_graph[pkg_name].add(provider_pkg)
-                in_degree[pkg_name] += 1
-    
-    # Add transitive dependencies for packages not in build list
-    for pkg in packages:
-        pkg_name = pkg['name']
-        
-        # Check ALL dependency types that are NOT in our build list
-        all_deps = []
-        for dep_type in ['depends', 'makedepends', 'checkdepends']:
-            all_deps.extend(pkg.get(dep_type, []))
-        
-        for dep_str in all_deps:
-            dep_name = extract_dep_name(dep_str)
-            
-            # Skip if dep is in our build list (already handled)
-            if dep_name in pkg_map:
-                continue
-                
-            # Look up dep in full package databases
-            dep_pkg = None
-            if all_x86_packages and dep_name in all_x86_packages:
-                dep_pkg = all_x86_packages[dep_name]
-            elif all_target_packages and dep_name in all_target_packages:
-                dep_pkg = all_target_packages[dep_name]
-                
-            if dep_pkg:
-                # Check what this dependency depends on
-                for transitive_dep_str in dep_pkg.get('depends', []):
-                    transitive_dep_name = extract_dep_name(transitive_dep_str)
-                    
-                    # If the transitive dependency IS in our build list, create edge
-                    if transitive_dep_name in pkg_map and transitive_dep_name != pkg_name:
-                        # Only increment in_degree if this is a NEW edge
-                        if transitive_dep_name not in reverse_graph[pkg_name]:
-                            graph[transitive_dep_name].add(pkg_name)
-                            reverse_graph[pkg_name].add(transitive_dep_name)
-                            in_degree[pkg_name] += 1
     
     # Find strongly connected components (cycles)
     sccs = find_strongly_connected_components(runtime_reverse_graph)
@@ -1060,14 +1024,9 @@ def sort_by_build_order(packages, all_x86_packages=None, all_target_packages=Non
     for pkg in packages:
         if not _is_ghc_compiled(pkg):
             continue
-        for dep_str in pkg.get('depends', []):
-            dep_name = extract_dep_name(dep_str)
-            if dep_name == pkg['name']:
-                continue
-            provider = dep_name if dep_name in pkg_map else all_provides.get(dep_name)
-            if provider and provider in pkg_map and provider != pkg['name']:
-                if _is_ghc_compiled(pkg_map[provider]):
-                    depends_only_rev[pkg['name']].add(provider)
+        for provider in dep_providers[pkg['name']]['depends']:
+            if _is_ghc_compiled(pkg_map[provider]):
+                depends_only_rev[pkg['name']].add(provider)
     ghc_sccs = find_strongly_connected_components(depends_only_rev)
     ghc_cycles = [s for s in ghc_sccs if len(s) > 1]
     if ghc_cycles:
@@ -1081,12 +1040,13 @@ def sort_by_build_order(packages, all_x86_packages=None, all_target_packages=Non
             print(f"  Cycle {i+1} ({len(scc)} packages): {', '.join(sorted(scc))}")
         print(f"{'='*SEPARATOR_WIDTH}\n")
 
-    # Identify actual cycles (SCCs with more than one node or self-loops)
+    # Identify actual cycles. Self-dependencies never reach the graph, so only
+    # SCCs with more than one node are cycles.
     cycles = []
     cycle_map = {}  # pkg_name -> cycle_id
     
     for scc in sccs:
-        if len(scc) > 1 or (len(scc) == 1 and scc[0] in reverse_graph.get(scc[0], set())):
+        if len(scc) > 1:
             cycle_id = len(cycles)
             cycles.append(scc)
             for pkg_name in scc:
@@ -1104,25 +1064,9 @@ def sort_by_build_order(packages, all_x86_packages=None, all_target_packages=Non
                 if pkg['name'] in cycle_pkg_set:
                     continue  # Skip packages in the same cycle
                 
-                # Check if this external package depends on any package in the cycle
-                all_deps = []
-                for dep_type in ['depends', 'makedepends', 'checkdepends']:
-                    all_deps.extend(pkg.get(dep_type, []))
-                
-                for dep_str in all_deps:
-                    dep_name = extract_dep_name(dep_str)
-                    
-                    # Resolve provides relationships
-                    provider_pkg = None
-                    if dep_name in pkg_map:
-                        provider_pkg = dep_name
-                    elif dep_name in all_provides:
-                        provider_pkg = all_provides[dep_name]
-                    
-                    # If dependency resolves to a package in this cycle, count it
-                    if provider_pkg and provider_pkg in cycle_pkg_set:
-                        external_dep_count += 1
-                        break  # Only count each external package once per cycle
+                # Only count each external package once per cycle
+                if any(provider_pkg in cycle_pkg_set for provider_pkg in _all_dep_providers(pkg['name'])):
+                    external_dep_count += 1
             
             cycle_external_deps.append((cycle_id, external_dep_count, cycle_pkgs))
         
@@ -1147,50 +1091,21 @@ def sort_by_build_order(packages, all_x86_packages=None, all_target_packages=Non
     external_deps_for_cycles = set()
     for cycle_id, cycle_pkgs in enumerate(cycles):
         for pkg_name in cycle_pkgs:
-            pkg = pkg_map[pkg_name]
-            all_deps = []
-            for dep_type in ['depends', 'makedepends', 'checkdepends']:
-                all_deps.extend(pkg.get(dep_type, []))
-            
-            for dep_str in all_deps:
-                dep_name = extract_dep_name(dep_str)
-                
-                # Find the provider
-                provider_pkg = None
-                if dep_name in pkg_map:
-                    provider_pkg = dep_name
-                elif dep_name in all_provides:
-                    provider_pkg = all_provides[dep_name]
-                
-                # If dependency is outside all cycles, it's an external dependency
-                if provider_pkg and provider_pkg in pkg_map and provider_pkg != pkg_name:
-                    is_in_any_cycle = any(provider_pkg in cycle for cycle in cycles)
-                    if not is_in_any_cycle:
-                        external_deps_for_cycles.add(provider_pkg)
+            # If dependency is outside all cycles, it's an external dependency
+            for provider_pkg in _all_dep_providers(pkg_name):
+                if provider_pkg not in cycle_map:
+                    external_deps_for_cycles.add(provider_pkg)
     
     # Recursively expand external deps to include all their transitive dependencies
     # within the build list (so they're all built before the cycles)
-    cycle_pkg_set = set()
-    for cycle_pkgs in cycles:
-        cycle_pkg_set.update(cycle_pkgs)
+    cycle_pkg_set = cycle_map.keys()
     
     changed = True
     while changed:
         changed = False
         for pkg_name in list(external_deps_for_cycles):
-            pkg = pkg_map[pkg_name]
-            all_deps = []
-            for dep_type in ['depends', 'makedepends', 'checkdepends']:
-                all_deps.extend(pkg.get(dep_type, []))
-            for dep_str in all_deps:
-                dep_name = extract_dep_name(dep_str)
-                provider_pkg = None
-                if dep_name in pkg_map:
-                    provider_pkg = dep_name
-                elif dep_name in all_provides:
-                    provider_pkg = all_provides[dep_name]
-                if (provider_pkg and provider_pkg in pkg_map and 
-                    provider_pkg not in external_deps_for_cycles and
+            for provider_pkg in _all_dep_providers(pkg_name):
+                if (provider_pkg not in external_deps_for_cycles and
                     provider_pkg not in cycle_pkg_set):
                     external_deps_for_cycles.add(provider_pkg)
                     changed = True
@@ -1207,12 +1122,8 @@ def sort_by_build_order(packages, all_x86_packages=None, all_target_packages=Non
         
         for pkg in external_packages:
             pkg_name = pkg['name']
-            all_deps = []
-            for dep_type in ['depends', 'makedepends', 'checkdepends']:
-                all_deps.extend(pkg.get(dep_type, []))
-            
             seen_ext_providers = set()
-            for dep_str in all_deps:
+            for dep_str in iter_all_deps(pkg):
                 dep_name = extract_dep_name(dep_str)
                 # Resolve through provides (e.g., llvm-libs -> llvm)
                 resolved = dep_name
@@ -1225,44 +1136,16 @@ def sort_by_build_order(packages, all_x86_packages=None, all_target_packages=Non
                         ext_in_degree[pkg_name] += 1
         
         # Topological sort for external dependencies (level-by-level)
-        queue = deque()
-        for pkg in external_packages:
-            if ext_in_degree[pkg['name']] == 0:
-                queue.append((pkg['name'], current_stage))
-        
-        while queue:
-            next_queue = deque()
-            stage_packages = []
-            
-            while queue:
-                pkg_name, stage = queue.popleft()
-                if stage == current_stage:
-                    stage_packages.append(pkg_name)
-                else:
-                    next_queue.append((pkg_name, stage))
-            
-            if not stage_packages:
-                current_stage += 1
-                queue = next_queue
-                continue
-            
+        for stage_packages in _topological_levels([pkg['name'] for pkg in external_packages],
+                                                  ext_graph, ext_in_degree):
             for pkg_name in stage_packages:
-                pkg = pkg_map[pkg_name].copy()
-                pkg['build_stage'] = current_stage
-                pkg['cycle_group'] = None
-                pkg['cycle_stage'] = None
-                pkg['_sequence'] = sequence_counter
+                pkg = pkg_map[pkg_name]
+                pkg.update(build_stage=current_stage, cycle_group=None,
+                           cycle_stage=None, _sequence=sequence_counter)
                 sequence_counter += 1
                 result.append(pkg)
                 processed_packages.add(pkg_name)
-                
-                for dependent in ext_graph[pkg_name]:
-                    ext_in_degree[dependent] -= 1
-                    if ext_in_degree[dependent] == 0:
-                        next_queue.append((dependent, current_stage + 1))
-            
             current_stage += 1
-            queue = next_queue
     
     # Now process cycles
     for cycle_id, cycle_pkgs in enumerate(cycles):
@@ -1272,10 +1155,7 @@ def sort_by_build_order(packages, all_x86_packages=None, all_target_packages=Non
         dep_count = {name: 0 for name in cycle_pkgs}
         for pkg_name in cycle_pkgs:
             pkg = pkg_map[pkg_name]
-            all_deps = []
-            for dep_type in ['depends', 'makedepends', 'checkdepends']:
-                all_deps.extend(pkg.get(dep_type, []))
-            for dep_str in all_deps:
+            for dep_str in iter_all_deps(pkg):
                 dep_name = extract_dep_name(dep_str)
                 provider = dep_name
                 if dep_name not in cycle_pkg_set and dep_name in all_provides:
@@ -1286,22 +1166,16 @@ def sort_by_build_order(packages, all_x86_packages=None, all_target_packages=Non
 
         # Add first build of cycle packages
         for pkg_name in sorted_cycle_pkgs:
-            pkg = pkg_map[pkg_name].copy()
-            pkg['build_stage'] = current_stage
-            pkg['cycle_group'] = cycle_id
-            pkg['cycle_stage'] = 1
-            pkg['_sequence'] = sequence_counter
+            pkg = {**pkg_map[pkg_name], 'build_stage': current_stage, 'cycle_group': cycle_id,
+                   'cycle_stage': 1, '_sequence': sequence_counter}
             sequence_counter += 1
             result.append(pkg)
             processed_packages.add(pkg_name)
         
         # Add second build of cycle packages
         for pkg_name in cycle_pkgs:
-            pkg = pkg_map[pkg_name].copy()
-            pkg['build_stage'] = current_stage + 1
-            pkg['cycle_group'] = cycle_id
-            pkg['cycle_stage'] = 2
-            pkg['_sequence'] = sequence_counter
+            pkg = {**pkg_map[pkg_name], 'build_stage': current_stage + 1, 'cycle_group': cycle_id,
+                   'cycle_stage': 2, '_sequence': sequence_counter}
             sequence_counter += 1
             result.append(pkg)
         
@@ -1324,31 +1198,16 @@ def sort_by_build_order(packages, all_x86_packages=None, all_target_packages=Non
 
         for pkg in remaining_packages:
             pkg_name = pkg['name']
-            # First pass collects provider per dep type (depends wins over makedepends over checkdepends)
+            # Collect provider per dep type; types are visited strongest first
+            # (depends > makedepends > checkdepends), so the first one seen wins
             seen_providers = {}  # provider -> dep_type
             for dep_type in ('depends', 'makedepends', 'checkdepends'):
-                for dep_str in pkg.get(dep_type, []):
-                    dep_name = extract_dep_name(dep_str)
-                    if dep_name == pkg_name:
-                        continue
-                    provider_pkg = None
-                    if dep_name in pkg_map:
-                        provider_pkg = dep_name
-                    elif dep_name in all_provides:
-                        provider_pkg = all_provides[dep_name]
-                    if not (provider_pkg and provider_pkg in pkg_map and provider_pkg != pkg_name):
-                        continue
+                for provider_pkg in dep_providers[pkg_name][dep_type]:
                     if provider_pkg in processed_packages:
                         continue  # Dep was in an earlier cycle group — already built
                     if provider_pkg not in remaining_set:
                         continue
-                    # Keep the strongest edge type seen: depends > makedepends > checkdepends
-                    priority = {'depends': 0, 'makedepends': 1, 'checkdepends': 2}
-                    if provider_pkg in seen_providers:
-                        if priority[dep_type] < priority[seen_providers[provider_pkg]]:
-                            seen_providers[provider_pkg] = dep_type
-                    else:
-                        seen_providers[provider_pkg] = dep_type
+                    seen_providers.setdefault(provider_pkg, dep_type)
             for provider_pkg, dt in seen_providers.items():
                 remaining_rev[pkg_name].add(provider_pkg)
                 edge_types[(pkg_name, provider_pkg)] = dt
@@ -1388,65 +1247,59 @@ def sort_by_build_order(packages, all_x86_packages=None, all_target_packages=Non
                 remaining_in_degree[dependent] += 1
         
         # Topological sort for remaining packages
-        queue = deque()
-        for pkg in remaining_packages:
-            if remaining_in_degree[pkg['name']] == 0:
-                queue.append((pkg['name'], current_stage))
-        
-        while queue:
-            next_queue = deque()
-            stage_packages = []
-            
-            while queue:
-                pkg_name, stage = queue.popleft()
-                if stage == current_stage:
-                    stage_packages.append(pkg_name)
-                else:
-                    next_queue.append((pkg_name, stage))
-            
-            if not stage_packages:
-                current_stage += 1
-                queue = next_queue
-                continue
-            
+        for stage_packages in _topological_levels([pkg['name'] for pkg in remaining_packages],
+                                                  remaining_graph, remaining_in_degree):
             for pkg_name in stage_packages:
-                pkg = pkg_map[pkg_name].copy()
-                pkg['build_stage'] = current_stage
-                pkg['cycle_group'] = None
-                pkg['cycle_stage'] = None
-                pkg['_sequence'] = sequence_counter
+                pkg = pkg_map[pkg_name]
+                pkg.update(build_stage=current_stage, cycle_group=None,
+                           cycle_stage=None, _sequence=sequence_counter)
                 sequence_counter += 1
                 result.append(pkg)
-                
-                for dependent in remaining_graph[pkg_name]:
-                    remaining_in_degree[dependent] -= 1
-                    if remaining_in_degree[dependent] == 0:
-                        next_queue.append((dependent, current_stage + 1))
-            
             current_stage += 1
-            queue = next_queue
     
-    # Sort by build stage, then by cycle stage, then by sequence (preserves topological order)
-    sorted_result = sorted(result, key=lambda x: (x['build_stage'], x.get('cycle_stage') or 0, x.get('_sequence', 0)))
+    # Stages are assigned in increasing order and every stage is emitted by a
+    # single loop, so result is already ordered by (build_stage, cycle_stage,
+    # _sequence) and needs no final sort.
     
     # Ensure all input packages are included in the result
-    result_names = {pkg['name'] for pkg in sorted_result}
+    result_names = {pkg['name'] for pkg in result}
     missing_packages = []
     for pkg in packages:
         if pkg['name'] not in result_names:
-            pkg_copy = pkg.copy()
-            pkg_copy['build_stage'] = 0
-            pkg_copy['cycle_group'] = None
-            pkg_copy['cycle_stage'] = None
-            missing_packages.append(pkg_copy)
+            pkg.update(build_stage=0, cycle_group=None, cycle_stage=None)
+            missing_packages.append(pkg)
     
     if missing_packages:
         # Insert missing packages at the beginning (stage 0)
-        sorted_result = missing_packages + sorted_result
-        # Re-sort to maintain proper ordering
-        sorted_result = sorted(sorted_result, key=lambda x: (x['build_stage'], x.get('cycle_stage') or 0, x.get('_sequence', 0)))
+        result = missing_packages + result
+    
+    return result
+
+def _load_arch_map(repos=('core', 'extra')):
+    """
+    Map package names and basenames to their ARCH from the local x86_64 databases.
     
-    return sorted_result
+    Used to tell ARCH=any packages (filtered out of the normal package load)
+    apart from packages that don't exist at all. The databases come from
+    parse_database_file's entry cache, which the regular package load has
+    just filled, so they are not decompressed and parsed a second time.
+    When a name appears more than once, the first entry wins.
+    
+    Args:
+        repos: Repository names whose {repo}_x86_64.db files are scanned, in order
+        
+    Returns:
+        dict: Package name or basename -> ARCH value ('' if the entry has none)
+    """
+    arch_map = {}
+    set_arch = arch_map.setdefault
+    for repo in repos:
+        db_filename = f"{repo}_x86_64.db"
+        if os.path.exists(db_filename):
+            for name, pkg in parse_database_file(db_filename, include_any=True).items():
+                set_arch(name, pkg['arch'])
+                set_arch(pkg['basename'], pkg['arch'])
+    return arch_map
 
 if __name__ == "__main__":
     # Clean up state from previous builds
@@ -1498,6 +1351,8 @@ if __name__ == "__main__":
     
     parser.add_argument('--no-check', action='store_true',
                         help='Exclude checkdepends from dependency resolution')
+    parser.add_argument('-j', '--jobs', type=int, default=10,
+                        help='Number of PKGBUILDs to fetch in parallel (default: 10)')
     
     args = parser.parse_args()
     
@@ -1569,7 +1424,7 @@ if __name__ == "__main__":
         target_packages = {}
         
         # Parse PKGBUILDs for dependencies
-        newer_packages = fetch_pkgbuild_deps(newer_packages, True, all_x86_packages, target_packages)
+        newer_packages = fetch_pkgbuild_deps(newer_packages, True, all_x86_packages, target_packages, args.jobs)
         
         if args.preserve_order:
             newer_packages = preserve_package_order(newer_packages, args.packages)
@@ -1611,7 +1466,7 @@ if __name__ == "__main__":
             # Fetch PKGBUILDs and write results
             if newer_packages:
                 log("Processing PKGBUILDs for dependency information...")
-                newer_packages = fetch_pkgbuild_deps(newer_packages, args.no_update, {}, {})
+                newer_packages = fetch_pkgbuild_deps(newer_packages, args.no_update, {}, {}, args.jobs)
             
             # Validate that PKGBUILDs were actually fetched
             failed_aur = []
@@ -1669,65 +1524,43 @@ if __name__ == "__main__":
         else:
             log(f"Looking up versions for {len(args.packages)} specified packages...")
             # Load x86_64 packages and target packages for dependency checking
-            # Include ARCH=any packages if --force is used
-            if args.force:
-                from utils import load_packages_with_any, X86_64_MIRROR
-                any_urls = [
-                    f"{X86_64_MIRROR}/core/os/x86_64/core.db",
-                    f"{X86_64_MIRROR}/extra/os/x86_64/extra.db"
-                ]
-                all_x86_packages = load_packages_with_any(any_urls, '_x86_64', download=not args.no_update, include_any=True, verbose=verbose)
-            else:
-                all_x86_packages = load_x86_64_packages(verbose=verbose, download=not args.no_update, include_testing=args.upstream_testing)
-            target_packages = load_target_arch_packages(verbose=verbose, download=not args.no_update, include_testing=args.target_testing)
+            # in parallel; include ARCH=any packages if --force is used
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                if args.force:
+                    from utils import load_packages_with_any, X86_64_MIRROR
+                    any_urls = [
+                        f"{X86_64_MIRROR}/core/os/x86_64/core.db",
+                        f"{X86_64_MIRROR}/extra/os/x86_64/extra.db"
+                    ]
+                    x86_future = executor.submit(load_packages_with_any, any_urls, '_x86_64', download=not args.no_update, include_any=True, verbose=verbose)
+                else:
+                    x86_future = executor.submit(load_x86_64_packages, verbose=verbose, download=not args.no_update, include_testing=args.upstream_testing)
+                target_future = executor.submit(load_target_arch_packages, verbose=verbose, download=not args.no_update, include_testing=args.target_testing)
+                all_x86_packages = x86_future.result()
+                target_packages = target_future.result()
             
             # Filter to only requested packages for comparison, but keep full list for dependency resolution
             filtered_x86_packages = {}
+            arch_map = None  # Loaded on the first package missing from all_x86_packages
+            # First package name per basename, so pkgbase lookups are a dict hit
+            first_by_basename = {}
+            for name, pkg_data in all_x86_packages.items():
+                first_by_basename.setdefault(pkg_data['basename'], name)
             for pkg_name in args.packages:
                 if pkg_name in all_x86_packages:
                     filtered_x86_packages[pkg_name] = all_x86_packages[pkg_name]
                 else:
                     # Check if it's a basename (pkgbase) instead of package name
-                    found_by_basename = False
-                    for name, pkg_data in all_x86_packages.items():
-                        if pkg_data['basename'] == pkg_name:
-                            filtered_x86_packages[name] = pkg_data
-                            found_by_basename = True
-                            break
-                    
-                    if not found_by_basename:
+                    name = first_by_basename.get(pkg_name)
+                    if name is not None:
+                        filtered_x86_packages[name] = all_x86_packages[name]
+                    else:
                         # Check if package exists but is ARCH=any (filtered out)
-                        arch_any_found = False
-                        is_arch_any = False
-                        for repo in ['core', 'extra']:
-                            try:
-                                db_filename = f"{repo}_x86_64.db"
-                                if os.path.exists(db_filename):
-                                    with tarfile.open(db_filename, 'r:gz') as tar:
-                                        for member in tar.getmembers():
-                                            if member.name.endswith('/desc'):
-                                                desc_content = tar.extractfile(member).read().decode('utf-8')
-                                                lines = desc_content.strip().split('\n')
-                                                data = {}
-                                                current_key = None
-                                                
-                                                for line in lines:
-                                                    if line.startswith('%') and line.endswith('%'):
-                                                        current_key = line[1:-1]
-                                                        data[current_key] = []
-                                                    elif current_key and line:
-                                                        data[current_key].append(line)
-                                                
-                                                if ('NAME' in data and data['NAME'][0] == pkg_name) or \
-                                                   ('BASE' in data and data['BASE'][0] == pkg_name):
-                                                    if data.get('ARCH', [''])[0] == 'any':
-                                                        is_arch_any = True
-                                                    arch_any_found = True
-                                                    break
-                                        if arch_any_found:
-                                            break
-                            except Exception:
-                                continue
+                        if arch_map is None:
+                            arch_map = _load_arch_map()
+                        arch_any_found = pkg_name in arch_map
+                        is_arch_any = arch_map.get(pkg_name) == 'any'
                         
                         if not arch_any_found:
                             print(f"ERROR: Package {pkg_name} not found in x86_64 repositories")
@@ -1792,11 +1625,13 @@ if __name__ == "__main__":
     
     # Load provides mapping once (doesn't change)
     log("Loading provides mapping from upstream databases...")
+    target_provides = build_target_provides(target_packages)
     
     # Stage 1: Find outdated packages using .db files (fast comparison)
     newer_packages, skipped_packages, bin_package_warnings = compare_versions(
         x86_packages, target_packages, args.packages, blacklist, 
-        args.use_aur_for_packages, args.use_latest, full_x86_packages
+        args.use_aur_for_packages, args.use_latest, full_x86_packages,
+        target_provides
     )
     
     # Handle --rebuild-repo option
@@ -1805,6 +1640,7 @@ if __name__ == "__main__":
         repo_packages = []
         toolchain_packages = {'gcc', 'binutils', 'glibc'}
         seen_basenames = set()
+        rebuild_bl = CompiledBlacklist(blacklist)
         
         for pkg_name, pkg_data in x86_packages.items():
             if pkg_data['repo'] == args.rebuild_repo:
@@ -1812,29 +1648,21 @@ if __name__ == "__main__":
                 if basename in toolchain_packages or basename in seen_basenames:
                     continue
                     
-                blacklist_reason = None
-                if blacklist:
-                    for pattern in blacklist:
-                        if fnmatch.fnmatch(basename, pattern):
-                            blacklist_reason = f"basename '{basename}' matches pattern '{pattern}'"
-                            break
-                        if fnmatch.fnmatch(pkg_name, pattern):
-                            blacklist_reason = f"package '{pkg_name}' matches pattern '{pattern}'"
-                            break
+                if rebuild_bl.matches(basename) or rebuild_bl.matches(pkg_name):
+                    continue
                 
-                if not blacklist_reason:
-                    seen_basenames.add(basename)
-                    repo_packages.append({
-                        'name': basename,
-                        'basename': basename,
-                        'version': pkg_data['version'],
-                        'repo': pkg_data['repo'],
-                        'depends': pkg_data['depends'],
-                        'makedepends': pkg_data['makedepends'],
-                        'provides': pkg_data['provides'],
-                        'force_latest': args.use_latest,
-                        'use_aur': False
-                    })
+                seen_basenames.add(basename)
+                repo_packages.append({
+                    'name': basename,
+                    'basename': basename,
+                    'version': pkg_data['version'],
+                    'repo': pkg_data['repo'],
+                    'depends': pkg_data['depends'],
+                    'makedepends': pkg_data['makedepends'],
+                    'provides': pkg_data['provides'],
+                    'force_latest': args.use_latest,
+                    'use_aur': False
+                })
         newer_packages = repo_packages
         info(f"Found {len(newer_packages)} packages in {args.rebuild_repo} repository")
     
@@ -1844,7 +1672,7 @@ if __name__ == "__main__":
     # Stage 2: Parse PKGBUILDs for complete dependency info and find missing deps
     if newer_packages:
         log("Processing PKGBUILDs for complete dependency information...")
-        newer_packages = fetch_pkgbuild_deps(newer_packages, args.no_update, full_x86_packages, target_packages)
+        newer_packages = fetch_pkgbuild_deps(newer_packages, args.no_update, full_x86_packages, target_packages, args.jobs)
         
         # Strip checkdepends if --no-check
         if args.no_check:
@@ -1854,7 +1682,8 @@ if __name__ == "__main__":
         
         if full_x86_packages:
             log("Checking for missing dependencies (including checkdepends)...")
-            missing_deps = find_missing_dependencies(newer_packages, full_x86_packages, target_packages)
+            missing_deps = find_missing_dependencies(newer_packages, full_x86_packages, target_packages,
+                                                     target_provides)
             if missing_deps:
                 print(f"Found {len(missing_deps)} missing dependencies: {', '.join(sorted(missing_deps))}")
                 
@@ -1883,18 +1712,17 @@ if __name__ == "__main__":
                             
                             dep_reasons[dep_name].append(f"{dep_type} for {pkg['name']}")
                 
+                missing_bl = CompiledBlacklist(blacklist)
+                newer_names = {p['name'] for p in newer_packages}
+                added_basenames = set()
                 for dep_name in missing_deps:
                     if dep_name in full_x86_packages:
                         pkg = full_x86_packages[dep_name]
                         basename = pkg['basename']
                         
-                        is_blacklisted = False
-                        for pattern in blacklist:
-                            if fnmatch.fnmatch(dep_name, pattern) or fnmatch.fnmatch(basename, pattern):
-                                is_blacklisted = True
-                                break
+                        is_blacklisted = missing_bl.matches(dep_name) or missing_bl.matches(basename)
                         
-                        if not is_blacklisted and basename not in [p['name'] for p in newer_packages]:
+                        if not is_blacklisted and basename not in newer_names:
                             reason = ", ".join(dep_reasons.get(dep_name, ["unknown reason"]))
                             newer_packages.append({
                                 'name': basename,
@@ -1909,142 +1737,101 @@ if __name__ == "__main__":
                                 'use_aur': False,
                                 'added_reason': reason,
                             })
+                            newer_names.add(basename)
+                            added_basenames.add(basename)
                 
                 # Parse PKGBUILDs only for newly added dependencies
-                added_basenames = []
-                for dep_name in missing_deps:
-                    if dep_name in full_x86_packages:
-                        basename = full_x86_packages[dep_name]['basename']
-                        if basename not in [p['name'] for p in newer_packages[:len(newer_packages) - len(missing_deps)]]:
-                            added_basenames.append(basename)
-                
                 if added_basenames:
                     # Create list of only the newly added packages
                     new_packages = [pkg for pkg in newer_packages if pkg['name'] in added_basenames]
                     log("Processing PKGBUILDs for missing dependencies...")
-                    new_packages_with_deps = fetch_pkgbuild_deps(new_packages, args.no_update, full_x86_packages, target_packages)
+                    new_packages_with_deps = fetch_pkgbuild_deps(new_packages, args.no_update, full_x86_packages, target_packages, args.jobs)
                     
                     # Update the newer_packages list with the processed new packages
+                    index_by_name = {pkg['name']: i for i, pkg in enumerate(newer_packages)}
                     for updated_pkg in new_packages_with_deps:
-                        for i, pkg in enumerate(newer_packages):
-                            if pkg['name'] == updated_pkg['name']:
-                                newer_packages[i] = updated_pkg
-                                break
+                        newer_packages[index_by_name[updated_pkg['name']]] = updated_pkg
                     
                     # Re-filter dependencies for all packages now that we have the complete list
                     log("Re-filtering dependencies with complete package list...")
                     
-                    build_list_names = {pkg['name'] for pkg in newer_packages}
-                    build_list_basenames = {pkg.get('basename', pkg['name']) for pkg in newer_packages}
-                    
-                    # Build provides mapping from ALL packages (x86_64 + target)
-                    build_list_provides = {}
-                    for pkg_dict in [full_x86_packages, target_packages]:
-                        for pkg_name, pkg_data in pkg_dict.items():
-                            basename = pkg_data.get('basename', pkg_name)
-                            build_list_provides[pkg_name] = basename
-                            build_list_provides[basename] = basename
-                            for provide in pkg_data.get('provides', []):
-                                provide_name = provide.split('=')[0]
-                                build_list_provides[provide_name] = basename
-                    
-                    # Add common split package patterns for packages in build list
-                    basenames_in_build = {pkg.get('basename', pkg['name']) for pkg in newer_packages}
-                    for basename in basenames_in_build:
-                        for suffix in ['-headers', '-docs', '-devel', '-dev']:
-                            split_name = basename + suffix
-                            if split_name not in build_list_provides:
-                                build_list_provides[split_name] = basename
-                    
-                    # Add common split package patterns for packages in build list
-                    basenames_in_build = {pkg.get('basename', pkg['name']) for pkg in newer_packages}
-                    for basename in basenames_in_build:
-                        for suffix in ['-headers', '-docs', '-devel', '-dev']:
-                            split_name = basename + suffix
-                            if split_name not in build_list_provides:
-                                build_list_provides[split_name] = basename
-                    
+                    valid_deps = known_dep_names(newer_packages, full_x86_packages, target_packages)
                     for pkg in newer_packages:
-                        # Filter dependencies for build ordering only
-                        for dep_type in ['depends', 'makedepends', 'checkdepends']:
-                            if dep_type in pkg:
-                                filtered_deps = []
-                                for dep in pkg.get(f'build_{dep_type}', pkg.get(dep_type, [])):
-                                    dep_name = extract_dep_name(dep)
-                                    # Skip self-dependencies
-                                    if dep_name == pkg['name']:
-                                        continue
-                                    if (dep_name in build_list_names or 
-                                        dep_name in build_list_basenames or
-                                        dep_name in build_list_provides):
-                                        filtered_deps.append(dep)
-                                pkg[dep_type] = filtered_deps
+                        filter_build_order_deps(pkg, valid_deps)
                     
     # Report results
     # Check if any skipped packages are dependencies of packages being built
     if skipped_packages and newer_packages:
-        # Extract package names from skipped packages (remove reason text)
-        skipped_names = set()
-        for skipped in skipped_packages:
-            # Extract package name before the first space and parenthesis
-            name = skipped.split(' (')[0]
-            skipped_names.add(name)
+        skipped_names = {name for name, _ in skipped_packages}
+        dep_names = {extract_dep_name(dep) for pkg in newer_packages for dep in iter_all_deps(pkg)}
         
         # Check if any skipped packages are dependencies
-        relevant_skipped = []
-        for pkg in newer_packages:
-            all_deps = pkg.get('depends', []) + pkg.get('makedepends', []) + pkg.get('checkdepends', [])
-            for dep in all_deps:
-                dep_name = extract_dep_name(dep)
-                if dep_name in skipped_names:
-                    # Check if pkgbase exists and is up-to-date in target or is provided
-                    if dep_name in x86_packages:
-                        x86_pkg = x86_packages[dep_name]
-                        x86_basename = x86_pkg.get('basename', dep_name)
-                        
-                        # Check if provided by another package
-                        is_provided = False
-                        for target_name, target_pkg in target_packages.items():
-                            provides_list = target_pkg.get('provides', [])
-                            for provide in provides_list:
-                                provide_name = provide.split('=')[0]
-                                if provide_name == dep_name:
-                                    is_provided = True
-                                    break
-                            if is_provided:
-                                break
-                        
-                        # Skip if pkgbase exists in target and is up-to-date or newer
-                        pkgbase_uptodate = False
-                        if x86_basename in target_packages:
-                            target_pkg = target_packages[x86_basename]
-                            if not is_version_newer(target_pkg['version'], x86_pkg['version']):
-                                pkgbase_uptodate = True
-                        
-                        if is_provided or pkgbase_uptodate:
-                            continue
-                    
-                    # Find the original skipped entry
-                    for skipped in skipped_packages:
-                        if skipped.startswith(dep_name + ' ('):
-                            relevant_skipped.append(skipped)
-                            break
+        relevant_skipped = set()
+        target_provide_names = None
+        for dep_name in dep_names & skipped_names:
+            # Check if pkgbase exists and is up-to-date in target or is provided
+            if dep_name in x86_packages:
+                x86_pkg = x86_packages[dep_name]
+                x86_basename = x86_pkg.get('basename', dep_name)
+                
+                # Check if provided by another package
+                if target_provide_names is None:
+                    target_provide_names = {provide.partition('=')[0]
+                                            for target_pkg in target_packages.values()
+                                            for provide in target_pkg.get('provides', [])}
+                is_provided = dep_name in target_provide_names
+                
+                # Skip if pkgbase exists in target and is up-to-date or newer
+                pkgbase_uptodate = False
+                if x86_basename in target_packages:
+                    target_pkg = target_packages[x86_basename]
+                    if not is_version_newer(target_pkg['version'], x86_pkg['version']):
+                        pkgbase_uptodate = True
+                
+                if is_provided or pkgbase_uptodate:
+                    continue
+            
+            relevant_skipped.add(dep_name)
         
         if relevant_skipped:
-            # Extract just the package names (remove the reason text)
-            unique_skipped_names = sorted(set(skipped.split(' (')[0] for skipped in relevant_skipped))
+            unique_skipped_names = sorted(relevant_skipped)
             log(f"Skipped {len(unique_skipped_names)} blacklisted packages that are dependencies: {', '.join(unique_skipped_names)}")
     elif skipped_packages and not newer_packages:
         # If no packages to build but some were skipped, show count only
         log(f"Skipped {len(skipped_packages)} blacklisted packages")
     
+    # Categorize packages by version change type in a single pass; the
+    # summary counts below are derived from the same buckets
+    upgrades = []
+    rebuilds = []
+    downgrades = []
+    missing = []
+    unknown_count = 0
+    
+    for pkg in newer_packages:
+        current = pkg.get('current_version', 'unknown')
+        new = pkg['version']
+        
+        if current == 'not found':
+            missing.append(pkg)
+        elif current == 'unknown':
+            unknown_count += 1
+            rebuilds.append(pkg)
+        elif current == new:
+            rebuilds.append(pkg)
+        elif is_version_newer(current, new):
+            upgrades.append(pkg)
+        else:
+            downgrades.append(pkg)
+    
     if args.packages:
         # Separate packages that need updates vs rebuilds
         rebuild_packages = []
         update_packages = []
+        newer_by_name = {pkg['name']: pkg for pkg in newer_packages}
         for pkg_name in args.packages:
-            if pkg_name in newer_packages:
-                pkg = newer_packages[pkg_name]
+            pkg = newer_by_name.get(pkg_name)
+            if pkg:
                 if pkg.get('version') == pkg.get('current_version'):
                     rebuild_packages.append(pkg_name)
                 else:
@@ -2057,8 +1844,8 @@ if __name__ == "__main__":
             info(f"Found {len(newer_packages)} packages")
     else:
         # Count outdated vs new packages
-        outdated_count = len([pkg for pkg in newer_packages if pkg.get('current_version', 'unknown') not in ['not found', 'unknown']])
-        new_count = len([pkg for pkg in newer_packages if pkg.get('current_version') == 'not found'])
+        new_count = len(missing)
+        outdated_count = len(newer_packages) - new_count - unknown_count
         
         if outdated_count > 0 and new_count > 0:
             info(f"Found {outdated_count} packages where x86_64 is newer and {new_count} missing package{'s' if new_count != 1 else ''}.")
@@ -2071,30 +1858,7 @@ if __name__ == "__main__":
         else:
             info(f"All packages are up to date. Nothing to build.")
     
-    # Categorize packages by version change type
     if newer_packages:
-        from utils import is_version_newer
-        
-        upgrades = []
-        rebuilds = []
-        downgrades = []
-        missing = []
-        
-        for pkg in newer_packages:
-            current = pkg.get('current_version', 'unknown')
-            new = pkg['version']
-            
-            if current == 'not found':
-                missing.append(pkg)
-            elif current == 'unknown':
-                rebuilds.append(pkg)
-            elif current == new:
-                rebuilds.append(pkg)
-            elif is_version_newer(current, new):
-                upgrades.append(pkg)
-            else:
-                downgrades.append(pkg)
-        
         # Show upgrades
         if upgrades:
             info("\nUpgrades:")
@@ -2171,41 +1935,30 @@ if __name__ == "__main__":
     
     write_results(sorted_packages, args)
     
-    # Build statistics
-    if sorted_packages:
-        # Calculate statistics excluding blacklisted packages
-        buildable_packages = [pkg for pkg in sorted_packages if pkg.get('skip', 0) != 1]
-        stage_counts = {}
-        for pkg in buildable_packages:
-            stage = pkg['build_stage']
-            stage_counts[stage] = stage_counts.get(stage, 0) + 1
-        
-        if stage_counts:
-            max_stage = max(stage_counts.keys())
-            if len(sorted_packages) > len(buildable_packages):
-                blacklisted_requested = len(sorted_packages) - len(buildable_packages)
-                print(f"Skipped {blacklisted_requested} blacklisted packages marked for upgrade:")
-                for pkg in sorted_packages:
-                    if pkg.get('skip', 0) == 1:
-                        print(f"  - {pkg['name']} ({pkg.get('blacklist_reason', 'blacklisted')})")
-    
-    
-    # Check if any critical bootstrap toolchain packages need updates (skip for --rebuild-repo)
-    if sorted_packages and not args.rebuild_repo:
-        critical_toolchain_packages = ['linux-api-headers', 'gcc', 'binutils']
-        outdated_toolchain = []
-        
-        for pkg in sorted_packages:
-            if pkg['name'] in critical_toolchain_packages:
-                outdated_toolchain.append(pkg['name'])
-        
-        if outdated_toolchain:
-            print(f"\n{'='*60}")
-            print(f"⚠️  WARNING: Bootstrap toolchain packages are outdated!")
-            print(f"{'='*60}")
-            print(f"The following toolchain packages need updates:")
-            for pkg_name in sorted(set(outdated_toolchain)):
-                print(f"  - {pkg_name}")
-            print(f"\nConsider running a bootstrap build:")
-            print(f"  ./build_packages.py --bootstrap-toolchain")
-            print(f"{'='*60}")
+    # Build statistics and toolchain check, gathered in one pass
+    has_buildable = False  # Any package left to build once blacklisted ones are skipped
+    blacklisted_requested = []
+    outdated_toolchain = set()  # Cycle packages appear twice
+    # The toolchain warning is not shown for --rebuild-repo
+    toolchain_names = frozenset() if args.rebuild_repo else CRITICAL_TOOLCHAIN_PACKAGES
+    for pkg in sorted_packages:
+        name = pkg['name']
+        if pkg.get('skip') == 1:
+            blacklisted_requested.append((name, pkg.get('blacklist_reason', 'blacklisted')))
+        else:
+            has_buildable = True
+        if name in toolchain_names:
+            outdated_toolchain.add(name)
+    
+    if has_buildable and blacklisted_requested:
+        lines = [f"Skipped {len(blacklisted_requested)} blacklisted packages marked for upgrade:"]
+        lines.extend(f"  - {name} ({reason})" for name, reason in blacklisted_requested)
+        print("\n".join(lines))
+    
+    
+    # Warn if any critical bootstrap toolchain packages need updates (skip for --rebuild-repo)
+    if outdated_toolchain:
+        lines = [_TOOLCHAIN_WARNING_HEADER]
+        lines.extend(f"  - {pkg_name}" for pkg_name in sorted(outdated_toolchain))
+        lines.append(_TOOLCHAIN_WARNING_FOOTER)
+        print("\n".join(lines))
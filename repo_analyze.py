@@ -8,7 +8,7 @@ from packaging import version
 
 from utils import (
     load_blacklist, get_target_architecture, is_version_newer,
-    load_all_packages_parallel, ArchVersionComparator
+    load_all_packages_parallel, ArchVersionComparator, extract_dep_name
 )
 
 
@@ -17,7 +17,7 @@ def build_provides_map(packages):
     provides = {}
     for pkg_name, pkg_data in packages.items():
         for provide in pkg_data.get('provides', []):
-            provide_name = provide.split('=')[0].split('<')[0].split('>')[0]
+            provide_name = extract_dep_name(provide)
             provides[provide_name] = pkg_name
     return provides
 
@@ -45,7 +45,7 @@ def is_blacklisted(basename, pkg_data, blacklist):
     
     all_deps = pkg_data.get('depends', []) + pkg_data.get('makedepends', [])
     for dep in all_deps:
-        dep_name = dep.split('=')[0].split('>')[0].split('<')[0]
+        dep_name = extract_dep_name(dep)
         for pattern in blacklist:
             if fnmatch.fnmatch(dep_name, pattern):
                 return True
@@ -207,7 +207,7 @@ def get_bin_package_version_info(basename, target_data, x86_packages):
         x86_version = x86_packages[counterpart]['version']
     else:
         for provide in target_data.get('provides', []):
-            provide_name = provide.split('=')[0].split('<')[0].split('>')[0].strip()
+            provide_name = extract_dep_name(provide)
             if provide_name in x86_packages:
                 x86_counterpart = x86_packages[provide_name]['basename']
                 x86_version = x86_packages[provide_name]['version']
@@ -6,6 +6,8 @@ This comprehensive test suite validates all components of the build system.
 Tests are organized by functionality and include clear descriptions.
 """
 
+import configparser
+import contextlib
 import json
 import tempfile
 import subprocess
@@ -43,12 +45,69 @@ except ImportError:
             
             return RaisesContext(exception_type, match)
 
+REPO_DIR = Path(__file__).resolve().parent
+
+# utils reads config.ini from the working directory at import time; import it
+# against the shipped example so the suite never depends on a local config
+_config_read = configparser.ConfigParser.read
+with patch.object(configparser.ConfigParser, 'read',
+                  lambda self, filenames, encoding=None: _config_read(
+                      self, REPO_DIR / 'config.ini.example', encoding)):
+    import utils
+
+
+@contextlib.contextmanager
+def _local_config():
+    """
+    Run inside a temporary directory holding a deployment's local config.
+    
+    Writes config.ini (from config.ini.example, with an unreachable
+    target_base_url so target database downloads fail fast) and
+    chroot-config/makepkg.conf, changes into the directory and points the
+    imported utils config at the same target_base_url. Scripts are run from
+    REPO_DIR by absolute path.
+    """
+    target_base_url = 'http://127.0.0.1:9/arch'
+    previous_cwd = os.getcwd()
+    previous_url = utils.config.get('build', 'target_base_url', fallback=None)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        config = configparser.ConfigParser()
+        config.read(REPO_DIR / 'config.ini.example')
+        config.set('build', 'target_base_url', target_base_url)
+        with open(Path(temp_dir) / 'config.ini', 'w') as f:
+            config.write(f)
+        (Path(temp_dir) / 'chroot-config').mkdir()
+        (Path(temp_dir) / 'chroot-config' / 'makepkg.conf').write_text('CARCH="aarch64"\n')
+        utils.config.set('build', 'target_base_url', target_base_url)
+        os.chdir(temp_dir)
+        try:
+            yield Path(temp_dir)
+        finally:
+            os.chdir(previous_cwd)
+            if previous_url is None:
+                utils.config.remove_option('build', 'target_base_url')
+            else:
+                utils.config.set('build', 'target_base_url', previous_url)
+
+
 from utils import (
     validate_package_name, safe_path_join, ArchVersionComparator, 
     PACKAGE_SKIP_FLAG, BUILD_ROOT, CACHE_PATH
 )
 
 
+def write_test_database(db_path, entries):
+    """Write a gzipped pacman database from a {member name: desc text} mapping"""
+    import io
+    import tarfile
+    with tarfile.open(db_path, 'w:gz') as tar:
+        for name, content in entries.items():
+            data = content.encode('utf-8')
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
 # =============================================================================
 # SECURITY TESTS - Package name validation and path traversal protection
 # =============================================================================
@@ -148,12 +207,13 @@ class TestBuildListGeneration:
     
     def test_generate_build_list_script_exists_and_runs(self):
         """The generate_build_list.py script should exist and show help"""
-        script_path = Path("generate_build_list.py")
+        script_path = REPO_DIR / "generate_build_list.py"
         assert script_path.exists(), "generate_build_list.py script not found"
         
         # Should be able to show help without errors
-        result = subprocess.run([f"./{script_path}", "--help"], 
-                              capture_output=True, text=True, timeout=10)
+        with _local_config():
+            result = subprocess.run([script_path, "--help"], 
+                                  capture_output=True, text=True, timeout=10)
         assert result.returncode == 0, f"Script failed to show help: {result.stderr}"
         assert "usage:" in result.stdout.lower(), "Help output doesn't contain usage information"
 
@@ -167,11 +227,12 @@ class TestPackageBuilding:
     
     def test_build_packages_script_exists_and_runs(self):
         """The build_packages.py script should exist and show help"""
-        script_path = Path("build_packages.py")
+        script_path = REPO_DIR / "build_packages.py"
         assert script_path.exists(), "build_packages.py script not found"
         
-        result = subprocess.run([f"./{script_path}", "--help"], 
-                              capture_output=True, text=True, timeout=10)
+        with _local_config():
+            result = subprocess.run([script_path, "--help"], 
+                                  capture_output=True, text=True, timeout=10)
         assert result.returncode == 0, f"Build script failed to show help: {result.stderr}"
     
     def test_dependency_parsing_works(self):
@@ -199,11 +260,12 @@ class TestBootstrapToolchain:
     
     def test_bootstrap_script_exists_and_runs(self):
         """The bootstrap_toolchain.py script should exist and show help"""
-        script_path = Path("bootstrap_toolchain.py")
+        script_path = REPO_DIR / "bootstrap_toolchain.py"
         assert script_path.exists(), "bootstrap_toolchain.py script not found"
         
-        result = subprocess.run([f"./{script_path}", "--help"], 
-                              capture_output=True, text=True, timeout=10)
+        with _local_config():
+            result = subprocess.run([script_path, "--help"], 
+                                  capture_output=True, text=True, timeout=10)
         assert result.returncode == 0, f"Bootstrap script failed to show help: {result.stderr}"
     
     def test_required_toolchain_packages_are_defined(self):
@@ -307,6 +369,16 @@ class TestDependencyResolution:
         except Exception as e:
             pytest.fail(f"Circular dependency caused crash: {e}")
 
+    def test_preserve_order_follows_command_line(self):
+        """--preserve-order should keep requested order, then input order"""
+        from generate_build_list import preserve_package_order
+
+        packages = [{'name': n} for n in ['zlib', 'gcc', 'extra-b', 'extra-a']]
+        result = preserve_package_order(packages, ['gcc', 'zlib', 'missing', 'gcc'])
+
+        assert [p['name'] for p in result] == ['gcc', 'zlib', 'extra-b', 'extra-a']
+        assert [p['build_stage'] for p in result] == [0, 1, 3, 4]
+
 
 # =============================================================================
 # CONFIGURATION TESTS - Configuration file handling
@@ -388,11 +460,12 @@ class TestIntegration:
         """All main scripts should be able to show help without errors"""
         scripts = ['generate_build_list.py', 'build_packages.py', 'bootstrap_toolchain.py']
         
-        for script in scripts:
-            if Path(script).exists():
-                result = subprocess.run([f'./{script}', '--help'], 
-                                      capture_output=True, text=True, timeout=10)
-                assert result.returncode == 0, f"Script {script} failed to show help: {result.stderr}"
+        with _local_config():
+            for script in scripts:
+                if (REPO_DIR / script).exists():
+                    result = subprocess.run([REPO_DIR / script, '--help'], 
+                                          capture_output=True, text=True, timeout=10)
+                    assert result.returncode == 0, f"Script {script} failed to show help: {result.stderr}"
     
     def test_json_output_format_is_valid(self):
         """Generated JSON output should be valid and well-formed"""
@@ -433,7 +506,146 @@ class TestDatabaseParsing:
         # Test that function exists and handles missing files gracefully
         result = parse_database_file("nonexistent.db")
         assert isinstance(result, dict), "Should return empty dict for missing file"
-    
+
+    DATABASE_ENTRIES = {
+        'foo-1.0-1/desc': "%NAME%\nfoo\n\n%BASE%\nfoo-base\n\n%VERSION%\n1.0-1\n\n"
+                          "%ARCH%\nx86_64\n\n%DEPENDS%\nglibc\nbar>=2\n\n%PROVIDES%\nlibfoo.so=1-64\n",
+        'any-2.0-1/desc': "%NAME%\nany\n\n%VERSION%\n2.0-1\n\n%ARCH%\nany\n",
+    }
+
+    def test_database_file_parsing_reads_desc_entries(self):
+        """Desc entries in a gzipped database should be parsed into package dicts"""
+        from utils import parse_database_file
+
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                patch('utils.DATABASE_CACHE_DIR', Path(temp_dir) / 'db_cache'), \
+                patch('utils.shutil.which', return_value=None):
+            db_path = os.path.join(temp_dir, 'test.db')
+            write_test_database(db_path, self.DATABASE_ENTRIES)
+
+            result = parse_database_file(db_path)
+            assert set(result) == {'foo'}, "ARCH=any packages should be skipped by default"
+            assert result['foo']['basename'] == 'foo-base'
+            assert result['foo']['depends'] == ['glibc', 'bar>=2']
+            assert result['foo']['provides'] == ['libfoo.so=1-64']
+            assert result['foo']['repo'] == 'unknown'
+
+            result = parse_database_file(db_path, include_any=True, repo='extra')
+            assert set(result) == {'foo', 'any'}
+            assert result['any']['basename'] == 'any'
+            assert {pkg['repo'] for pkg in result.values()} == {'extra'}
+
+    def test_desc_bytes_decodes_requested_sections(self):
+        """Raw desc parsing should match text parsing and decode only requested sections"""
+        from utils import parse_desc, parse_desc_bytes
+
+        text = self.DATABASE_ENTRIES['foo-1.0-1/desc']
+        raw = text.encode('utf-8')
+        assert parse_desc_bytes(raw) == parse_desc(text)
+        assert parse_desc_bytes(raw, {'NAME', 'DEPENDS'}) == {'NAME': ['foo'], 'DEPENDS': ['glibc', 'bar>=2']}
+
+    def test_database_parse_cache(self):
+        """Parsed entries should be cached outside the database's directory until it changes"""
+        from utils import parse_database_file, _database_cache_path
+
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                patch('utils.DATABASE_CACHE_DIR', Path(temp_dir) / 'db_cache'), \
+                patch('utils.shutil.which', return_value=None):
+            db_path = os.path.join(temp_dir, 'test.db')
+            write_test_database(db_path, self.DATABASE_ENTRIES)
+            assert set(parse_database_file(db_path)) == {'foo'}
+
+            cache_path = _database_cache_path(Path(db_path))
+            assert cache_path.parent == Path(temp_dir) / 'db_cache'
+            assert cache_path.exists()
+            assert not os.path.exists(db_path + '.cache')
+            with patch('utils.read_database_descs', side_effect=AssertionError("cache not used")):
+                assert set(parse_database_file(db_path)) == {'foo'}
+
+            # A new database (different mtime/size) is parsed again
+            write_test_database(db_path, {'bar-1.0-1/desc': "%NAME%\nbar\n\n%VERSION%\n1.0-1\n\n%ARCH%\nx86_64\n"})
+            os.utime(db_path, (2000000000, 2000000000))
+            assert set(parse_database_file(db_path)) == {'bar'}
+
+            # A corrupt cache is ignored and rewritten
+            cache_path.write_bytes(b"not a pickle")
+            assert set(parse_database_file(db_path)) == {'bar'}
+
+    def test_database_parsing_with_igzip(self):
+        """The external decompressor path should parse the same entries"""
+        import gzip
+        from utils import parse_database_file
+
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                patch('utils.DATABASE_CACHE_DIR', Path(temp_dir) / 'db_cache'):
+            db_path = os.path.join(temp_dir, 'test.db')
+            write_test_database(db_path, self.DATABASE_ENTRIES)
+            # igzip shares gzip's open() API
+            with patch('utils.igzip', gzip), patch('utils.shutil.which', return_value=None):
+                assert set(parse_database_file(db_path)) == {'foo'}
+
+    def test_database_parsing_with_bsdtar(self):
+        """Concatenated bsdtar desc output should be split back into entries"""
+        from utils import parse_database_file
+
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                patch('utils.DATABASE_CACHE_DIR', Path(temp_dir) / 'db_cache'):
+            db_path = os.path.join(temp_dir, 'test.db')
+            write_test_database(db_path, self.DATABASE_ENTRIES)
+            fake_bsdtar = os.path.join(temp_dir, 'bsdtar')
+            with open(fake_bsdtar, 'w') as f:
+                f.write('#!/bin/sh\nexec tar -xzOf "$2" --wildcards "$3"\n')
+            os.chmod(fake_bsdtar, 0o755)
+            with patch('utils.shutil.which', return_value=fake_bsdtar):
+                result = parse_database_file(db_path, include_any=True)
+            assert set(result) == {'foo', 'any'}
+            assert result['foo']['provides'] == ['libfoo.so=1-64']
+            assert result['any']['basename'] == 'any'
+
+    def test_database_parsing_falls_back_when_bsdtar_misbehaves(self):
+        """A hung bsdtar or unsplittable output should fall back to tarfile"""
+        import subprocess
+        from utils import read_database_descs
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            db_path = os.path.join(temp_dir, 'test.db')
+            write_test_database(db_path, self.DATABASE_ENTRIES)
+            fake_bsdtar = os.path.join(temp_dir, 'bsdtar')
+            with open(fake_bsdtar, 'w') as f:
+                f.write('#!/bin/sh\nprintf "%%ARCH%%\\nx86_64\\n\\n"\n')
+            os.chmod(fake_bsdtar, 0o755)
+
+            with patch('utils.shutil.which', return_value=fake_bsdtar):
+                names = {data['NAME'][0] for data in read_database_descs(db_path)}
+            assert names == {'foo', 'any'}, "Entries without NAME/VERSION should not be trusted"
+
+            with patch('utils.shutil.which', return_value=fake_bsdtar), \
+                    patch('utils.subprocess.run', side_effect=subprocess.TimeoutExpired('bsdtar', 60)):
+                names = {data['NAME'][0] for data in read_database_descs(db_path)}
+            assert names == {'foo', 'any'}
+
+    def test_arch_map_covers_names_and_basenames(self):
+        """ARCH lookup should find packages by name or basename, first repo winning"""
+        from generate_build_list import _load_arch_map
+
+        repos = {
+            'core': {'foo-1.0-1/desc': "%NAME%\nfoo\n\n%VERSION%\n1.0-1\n\n%BASE%\nfoo-base\n\n%ARCH%\nx86_64\n"},
+            'extra': {'bar-1.0-1/desc': "%NAME%\nbar\n\n%VERSION%\n1.0-1\n\n%ARCH%\nany\n",
+                      'foo-2.0-1/desc': "%NAME%\nfoo\n\n%VERSION%\n2.0-1\n\n%ARCH%\nany\n"},
+        }
+        with tempfile.TemporaryDirectory() as temp_dir:
+            original_cwd = os.getcwd()
+            os.chdir(temp_dir)
+            try:
+                for repo, entries in repos.items():
+                    write_test_database(f"{repo}_x86_64.db", entries)
+
+                arch_map = _load_arch_map()
+            finally:
+                os.chdir(original_cwd)
+
+        assert arch_map == {'foo': 'x86_64', 'foo-base': 'x86_64', 'bar': 'any'}
+
     def test_x86_64_package_loading(self):
         """x86_64 package loading should work"""
         from utils import load_x86_64_packages
@@ -451,12 +663,13 @@ class TestDatabaseParsing:
         from utils import load_target_arch_packages
         
         # Test function exists
-        try:
-            packages = load_target_arch_packages(download=False)
-            assert isinstance(packages, dict), "Should return dictionary"
-        except Exception:
-            # Expected if no cached databases exist
-            pass
+        with _local_config():
+            try:
+                packages = load_target_arch_packages(download=False)
+                assert isinstance(packages, dict), "Should return dictionary"
+            except Exception:
+                # Expected if no cached databases exist
+                pass
 
 
 # =============================================================================
@@ -536,10 +749,11 @@ class TestCommandLineInterface:
     
     def test_generate_build_list_cli_options(self):
         """generate_build_list.py should support all documented options"""
-        script = "./generate_build_list.py"
+        script = REPO_DIR / "generate_build_list.py"
         
         # Test help works
-        result = subprocess.run([script, "--help"], capture_output=True, text=True, timeout=10)
+        with _local_config():
+            result = subprocess.run([script, "--help"], capture_output=True, text=True, timeout=10)
         assert result.returncode == 0, "Help should work"
         
         help_text = result.stdout.lower()
@@ -550,9 +764,10 @@ class TestCommandLineInterface:
     
     def test_build_packages_cli_options(self):
         """build_packages.py should support all documented options"""
-        script = "./build_packages.py"
+        script = REPO_DIR / "build_packages.py"
         
-        result = subprocess.run([script, "--help"], capture_output=True, text=True, timeout=10)
+        with _local_config():
+            result = subprocess.run([script, "--help"], capture_output=True, text=True, timeout=10)
         assert result.returncode == 0, "Help should work"
         
         help_text = result.stdout.lower()
@@ -563,9 +778,10 @@ class TestCommandLineInterface:
     
     def test_bootstrap_toolchain_cli_options(self):
         """bootstrap_toolchain.py should support documented options"""
-        script = "./bootstrap_toolchain.py"
+        script = REPO_DIR / "bootstrap_toolchain.py"
         
-        result = subprocess.run([script, "--help"], capture_output=True, text=True, timeout=10)
+        with _local_config():
+            result = subprocess.run([script, "--help"], capture_output=True, text=True, timeout=10)
         assert result.returncode == 0, "Help should work"
         
         help_text = result.stdout.lower()
@@ -642,6 +858,31 @@ class TestFileOperations:
 class TestNetworkOperations:
     """Tests for network operations and download functionality"""
     
+    @staticmethod
+    @contextlib.contextmanager
+    def _serve(directory=None, handler_cls=None):
+        """Serve directory (or handler_cls) on a local port, yielding the base URL"""
+        import threading
+        from http.server import HTTPServer, SimpleHTTPRequestHandler
+
+        if handler_cls is None:
+            class QuietHandler(SimpleHTTPRequestHandler):
+                def __init__(self, *args, **kwargs):
+                    super().__init__(*args, directory=str(directory), **kwargs)
+
+                def log_message(self, *args):
+                    pass
+            handler_cls = QuietHandler
+
+        server = HTTPServer(('127.0.0.1', 0), handler_cls)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            yield f"http://127.0.0.1:{server.server_port}"
+        finally:
+            server.shutdown()
+            server.server_close()
+    
     def test_download_error_handling(self):
         """Download errors should be handled gracefully"""
         # Test that the system can handle network failures
@@ -650,13 +891,14 @@ class TestNetworkOperations:
         from utils import load_x86_64_packages, load_target_arch_packages
         
         # These should not crash even if network is unavailable
-        try:
-            load_x86_64_packages(download=False)
-            load_target_arch_packages(download=False)
-        except Exception as e:
-            # Should handle errors gracefully
-            assert "network" not in str(e).lower() or "connection" not in str(e).lower(), \
-                "Network errors should be handled gracefully"
+        with _local_config():
+            try:
+                load_x86_64_packages(download=False)
+                load_target_arch_packages(download=False)
+            except Exception as e:
+                # Should handle errors gracefully
+                assert "network" not in str(e).lower() or "connection" not in str(e).lower(), \
+                    "Network errors should be handled gracefully"
     
     def test_database_url_validation(self):
         """Database URLs should be validated properly"""
@@ -677,6 +919,132 @@ class TestNetworkOperations:
             # Should not crash with any URL format
             assert isinstance(url, str), "URL should be string"
 
+    def test_database_loading_without_urls(self):
+        """Loading an empty repository selection should return no packages"""
+        from utils import load_database_packages, load_packages_with_any
+
+        assert load_database_packages([], '_x86_64', download=False) == {}
+        assert load_packages_with_any([], '_x86_64', download=False) == {}
+
+    def test_database_download_is_conditional(self):
+        """Unchanged databases should not be downloaded again"""
+        from utils import download_database
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            served = Path(temp_dir) / "served"
+            served.mkdir()
+            (served / "core.db").write_bytes(b"database")
+            os.utime(served / "core.db", (1000000000, 1000000000))
+
+            with self._serve(served) as base_url:
+                url = f"{base_url}/core.db"
+                local = Path(temp_dir) / "core_x86_64.db"
+
+                assert download_database(url, local) is True
+                assert local.read_bytes() == b"database"
+                mtime = local.stat().st_mtime_ns
+                assert download_database(url, local) is False, "Should get 304 for unchanged file"
+                assert local.stat().st_mtime_ns == mtime, "A 304 should leave the database untouched"
+                assert not (Path(temp_dir) / "core_x86_64.db.part").exists()
+
+    def test_database_download_revalidates_server_last_modified(self):
+        """If-Modified-Since should echo the server's Last-Modified, not the local mtime"""
+        import email.utils
+        from utils import download_database, database_check_age
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            served = Path(temp_dir) / "served"
+            served.mkdir()
+            (served / "core.db").write_bytes(b"old")
+            os.utime(served / "core.db", (1000000000, 1000000000))
+
+            with self._serve(served) as base_url:
+                url = f"{base_url}/core.db"
+                local = Path(temp_dir) / "core_x86_64.db"
+
+                assert download_database(url, local) is True
+                assert (Path(temp_dir) / "core_x86_64.db.last-modified").read_text() == \
+                    email.utils.formatdate(1000000000, usegmt=True)
+                assert database_check_age(local) < 60
+
+                # A local clock far ahead of the mirror must not hide an update
+                os.utime(local, (4000000000, 4000000000))
+                (served / "core.db").write_bytes(b"new")
+                os.utime(served / "core.db", (1000000100, 1000000100))
+                assert download_database(url, local) is True
+                assert local.read_bytes() == b"new"
+
+    def test_database_download_sends_saved_etag(self):
+        """A saved ETag should be revalidated with If-None-Match"""
+        from http.server import BaseHTTPRequestHandler
+        from utils import download_database
+
+        class ETagHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.headers.get('If-None-Match') == '"v1"':
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                body = b"database"
+                self.send_response(200)
+                self.send_header('ETag', '"v1"')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        with self._serve(handler_cls=ETagHandler) as base_url, \
+                tempfile.TemporaryDirectory() as temp_dir:
+            url = f"{base_url}/core.db"
+            local = Path(temp_dir) / "core_x86_64.db"
+
+            assert download_database(url, local) is True
+            assert (Path(temp_dir) / "core_x86_64.db.etag").read_text() == '"v1"'
+            assert download_database(url, local) is False, "Matching ETag should give 304"
+
+    def test_failed_database_download_leaves_no_part_file(self):
+        """A download cut off part way should leave neither a database nor a .part file"""
+        from http.server import BaseHTTPRequestHandler
+        from utils import download_database
+
+        class TruncatingHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header('Content-Length', '100')
+                self.end_headers()
+                self.wfile.write(b"partial")
+
+            def log_message(self, *args):
+                pass
+
+        with self._serve(handler_cls=TruncatingHandler) as base_url, \
+                tempfile.TemporaryDirectory() as temp_dir:
+            local = Path(temp_dir) / "core_x86_64.db"
+
+            with pytest.raises(OSError):
+                download_database(f"{base_url}/core.db", local)
+            assert not local.exists()
+            assert not (Path(temp_dir) / "core_x86_64.db.part").exists()
+
+    def test_http_pool_grows_to_worker_count(self):
+        """The shared session's connection pool should fit every parallel download"""
+        import utils
+
+        session = MagicMock()
+        with patch('utils._HTTP_SESSION', session), patch('utils.requests', MagicMock()) as requests_mock, \
+                patch('utils._http_pool_size', 10):
+            utils._size_http_pool(4)
+            session.mount.assert_not_called()
+
+            utils._size_http_pool(16)
+            requests_mock.adapters.HTTPAdapter.assert_called_once_with(pool_maxsize=16)
+            assert {call.args[0] for call in session.mount.call_args_list} == {'http://', 'https://'}
+
+            utils._size_http_pool(12)
+            assert session.mount.call_count == 2
+
 
 # =============================================================================
 # BUILD SYSTEM TESTS - Build process and chroot management
@@ -753,7 +1121,8 @@ class TestArchitectureDetection:
         """Target architecture should be detected correctly"""
         try:
             from generate_build_list import get_target_architecture
-            arch = get_target_architecture()
+            with _local_config():
+                arch = get_target_architecture()
             assert isinstance(arch, str), "Architecture should be string"
             assert len(arch) > 0, "Architecture should not be empty"
         except ImportError:
@@ -1717,6 +2086,43 @@ package3
         assert 'vim-debug' not in names
         assert 'lib32-glibc' not in names
 
+    def test_compiled_blacklist_matches_like_fnmatch(self):
+        """CompiledBlacklist should match and report patterns like fnmatch"""
+        from generate_build_list import CompiledBlacklist
+
+        bl = CompiledBlacklist(['gcc', '*-debug', 'lib32-*', 'qt[56]-base'])
+
+        assert bl.matches('gcc')
+        assert bl.matches('vim-debug')
+        assert bl.matches('qt5-base')
+        assert not bl.matches('qt4-base')
+        assert not bl.matches('gcc-libs')
+        assert bl.matching_pattern('gcc') == 'gcc'
+        assert bl.matching_pattern('lib32-glibc') == 'lib32-*'
+        assert bl.matching_pattern('vim') is None
+        assert not CompiledBlacklist([])
+
+    def test_forced_blacklisted_package_keeps_package_data(self):
+        """Explicitly requested blacklisted packages should carry their real deps"""
+        from generate_build_list import compare_versions
+
+        x86 = {
+            'foo': {'name': 'foo', 'version': '2.0-1', 'basename': 'foo', 'repo': 'extra',
+                    'depends': ['glibc'], 'makedepends': ['cmake'], 'provides': ['libfoo.so']},
+        }
+        packages, skipped, _ = compare_versions(x86, {}, force_packages={'foo'},
+                                                blacklist=['foo'], full_x86_packages=x86)
+
+        assert len(skipped) == 1
+        assert skipped[0][0] == 'foo', "Skipped entries should be (basename, reason) tuples"
+        assert len(packages) == 1
+        pkg = packages[0]
+        assert pkg['skip'] == 1
+        assert pkg['version'] == '2.0-1'
+        assert pkg['depends'] == ['glibc']
+        assert pkg['makedepends'] == ['cmake']
+        assert 'pkg_data' not in pkg and 'packages' not in pkg
+
 
 # =============================================================================
 # FIND MISSING DEPENDENCIES TESTS
@@ -1788,6 +2194,35 @@ class TestFindMissingDependencies:
         missing = find_missing_dependencies(packages, x86_packages, target_packages)
         assert 'virtual-pkg' not in missing
 
+    def test_handles_long_dependency_chains(self):
+        """Transitive search should not hit the recursion limit on long chains"""
+        from utils import find_missing_dependencies
+
+        depth = sys.getrecursionlimit() * 2
+        x86_packages = {
+            f"dep{i}": {'name': f"dep{i}", 'basename': f"dep{i}", 'version': '1.0',
+                        'depends': [f"dep{i + 1}"] if i < depth else [], 'provides': []}
+            for i in range(depth + 1)
+        }
+        packages = [{'name': 'consumer', 'depends': ['dep0'], 'makedepends': [], 'checkdepends': []}]
+
+        missing = find_missing_dependencies(packages, x86_packages, {})
+        assert len(missing) == depth + 1
+
+    def test_target_provides_prefers_real_packages(self):
+        """Package names and pkgbases should map to themselves, not to providers"""
+        from utils import build_target_provides
+
+        real = {'name': 'foo', 'basename': 'foo-base', 'version': '1.0', 'provides': []}
+        provider = {'name': 'foo-bin', 'basename': 'foo-bin', 'version': '2.0',
+                    'provides': ['foo=2.0', 'foo-base', 'libfoo.so=1-64']}
+        target_provides = build_target_provides({'foo-bin': provider, 'foo': real})
+
+        assert target_provides['foo'] is real
+        assert target_provides['foo-base'] is real
+        assert target_provides['libfoo.so'] is provider
+        assert target_provides['foo-bin'] is provider
+
 
 # =============================================================================
 # BUILD UTILS CLASS TESTS
@@ -1971,6 +2406,19 @@ class TestMultipleDisconnectedCycles:
         cycle_a_first = names.index('cycle-a')
         assert ext_idx < cycle_a_first, "External dep should be built before cycle"
 
+    def test_scc_handles_long_chains(self):
+        """SCC detection should not hit the recursion limit on long chains"""
+        from generate_build_list import find_strongly_connected_components
+
+        depth = sys.getrecursionlimit() * 2
+        graph = {f"pkg{i}": {f"pkg{i + 1}"} for i in range(depth)}
+        graph[f"pkg{depth}"] = {"pkg0"}
+        graph["lonely"] = set()
+
+        sccs = find_strongly_connected_components(graph)
+        sizes = sorted(len(c) for c in sccs)
+        assert sizes == [1, depth + 1], "Chain closed into a loop should be one SCC"
+
 
 # =============================================================================
 # PACKAGE UPLOAD LOGIC TESTS
@@ -2109,6 +2557,70 @@ makedepends=()
             # Variable should be expanded
             assert any('somelib' in d for d in deps['depends'])
 
+    def test_parse_pkgbuild_deps_uses_content_cache(self):
+        """Unchanged PKGBUILDs should be served from the persistent deps cache"""
+        import tempfile
+        import utils
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache_file = Path(tmpdir) / ".deps_cache.json"
+            pkgbuild = Path(tmpdir) / "PKGBUILD"
+            pkgbuild.write_text("pkgname=test\npkgver=1.0\npkgrel=1\ndepends=('glibc')\n")
+
+            with patch('utils.PKGBUILD_DEPS_CACHE_FILE', cache_file), \
+                 patch('utils._pkgbuild_deps_cache', None), \
+                 patch('utils._pkgbuild_deps_cache_dirty', False):
+                first = utils.parse_pkgbuild_deps(pkgbuild)
+                with patch('utils.subprocess.run', side_effect=AssertionError("PKGBUILD sourced again")):
+                    assert utils.parse_pkgbuild_deps(pkgbuild) == first
+
+                utils.save_pkgbuild_deps_cache()
+                assert cache_file.exists()
+
+                # A fresh process reads the saved cache; edited PKGBUILDs are re-parsed
+                utils._pkgbuild_deps_cache = None
+                with patch('utils.subprocess.run', side_effect=AssertionError("PKGBUILD sourced again")):
+                    assert utils.parse_pkgbuild_deps(pkgbuild)['depends'] == ['glibc']
+                pkgbuild.write_text("pkgname=test\npkgver=1.0\npkgrel=2\ndepends=('zlib')\n")
+                assert utils.parse_pkgbuild_deps(pkgbuild)['depends'] == ['zlib']
+
+                # A cache saved by a different extraction script is discarded
+                utils.save_pkgbuild_deps_cache()
+                with patch('utils._PKGBUILD_DEPS_CACHE_VERSION', 'other'):
+                    utils._pkgbuild_deps_cache = None
+                    assert utils._get_pkgbuild_deps_cache() == {}
+
+                # Entries for PKGBUILDs that no longer exist are pruned
+                utils._pkgbuild_deps_cache = None
+                assert str(pkgbuild) in utils._get_pkgbuild_deps_cache()
+                pkgbuild.unlink()
+                utils._pkgbuild_deps_cache = None
+                assert utils._get_pkgbuild_deps_cache() == {}
+                utils.save_pkgbuild_deps_cache()
+                assert json.loads(cache_file.read_text())['entries'] == {}
+
+    def test_get_pkgbuild_version(self):
+        """Should read plain versions directly and expand variables via bash"""
+        import tempfile
+        from utils import get_pkgbuild_version
+
+        cases = [
+            ("pkgname=test\npkgver=1.2.3\npkgrel=2\n", "1.2.3-2"),
+            ("pkgname=test\nepoch=1\npkgver='4.5'\npkgrel=\"1\"\n", "1:4.5-1"),
+            ("pkgname=test\n_base=3.0\npkgver=${_base}.1\npkgrel=1\n", "3.0.1-1"),
+        ]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            pkgbuild = Path(tmpdir) / "PKGBUILD"
+            for content, expected in cases:
+                pkgbuild.write_text(content)
+                assert get_pkgbuild_version(pkgbuild) == expected
+
+            assert get_pkgbuild_version(Path(tmpdir) / "missing" / "PKGBUILD") is None
+
+            # Content passed in by the caller is used instead of the file
+            pkgbuild.write_text("pkgver=1.0\npkgrel=1\n")
+            assert get_pkgbuild_version(pkgbuild, b"pkgver=2.0\npkgrel=3\n") == "2.0-3"
+
 
 # =============================================================================
 # REPO ANALYZE SCRIPT TESTS
@@ -2119,10 +2631,11 @@ class TestRepoAnalyze:
     
     def test_script_exists_and_runs(self):
         """repo_analyze.py should exist and show help"""
-        script = Path("repo_analyze.py")
+        script = REPO_DIR / "repo_analyze.py"
         if script.exists():
-            result = subprocess.run(['./repo_analyze.py', '--help'], 
-                                  capture_output=True, text=True, timeout=10)
+            with _local_config():
+                result = subprocess.run([script, '--help'], 
+                                      capture_output=True, text=True, timeout=10)
             assert result.returncode == 0
 
 
@@ -2135,10 +2648,11 @@ class TestFindDependentsScript:
     
     def test_script_exists_and_runs(self):
         """find_dependents.py should exist and show help"""
-        script = Path("find_dependents.py")
+        script = REPO_DIR / "find_dependents.py"
         if script.exists():
-            result = subprocess.run(['./find_dependents.py', '--help'], 
-                                  capture_output=True, text=True, timeout=10)
+            with _local_config():
+                result = subprocess.run([script, '--help'], 
+                                      capture_output=True, text=True, timeout=10)
             # Script may exit with error if no package specified, but shouldn't crash
             assert result.returncode in [0, 1, 2]
 
@@ -2300,10 +2814,11 @@ def run_all_tests():
     ]
     
     for script, description in scripts_to_test:
-        if Path(script).exists():
+        if (REPO_DIR / script).exists():
             print(f"  Testing {description}...", end=" ")
-            result = subprocess.run([f'./{script}', '--help'], 
-                                  capture_output=True, text=True, timeout=10)
+            with _local_config():
+                result = subprocess.run([REPO_DIR / script, '--help'], 
+                                      capture_output=True, text=True, timeout=10)
             if result.returncode == 0:
                 print("✓")
             else:
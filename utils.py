@@ -16,16 +16,49 @@ including epoch versions, git revisions, and architecture filtering.
 
 import os
 import fnmatch
+import functools
+import gzip
+import hashlib
+import io
+import json
+import pickle
 import subprocess
 import sys
 import re
+import shlex
 import configparser
 import threading
 import tarfile
 import concurrent.futures
+import contextlib
+import shutil
+import urllib.request
+import urllib.error
 from pathlib import Path
 from packaging import version
 
+try:
+    from isal import igzip
+except ImportError:
+    igzip = None
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Shared across downloads so requests to the same mirror reuse keep-alive
+# connections instead of a new TCP/TLS handshake per database
+_HTTP_SESSION = requests.Session() if requests else None
+# Per-host connection pool size of _HTTP_SESSION (requests' default is 10)
+_http_pool_size = 10
+_http_pool_lock = threading.Lock()
+
 # Load configuration
 config = configparser.ConfigParser()
 config.read('config.ini')
@@ -40,12 +73,15 @@ LOG_RETENTION_COUNT = 3
 # Directory constants
 PKGBUILDS_DIR = "pkgbuilds"
 LOGS_DIR = "logs"
+PKGBUILD_DEPS_CACHE_FILE = Path(PKGBUILDS_DIR) / ".deps_cache.json"
+DATABASE_CACHE_DIR = Path(".db_cache")  # Parsed databases, see parse_database_file
 
 # Build constants
 TEMP_CHROOT_ID_MIN = 1000000  # 7-digit random ID range for temp chroots
 TEMP_CHROOT_ID_MAX = 9999999
 SEPARATOR_WIDTH = 60          # Width of === separator lines
 GIT_COMMAND_TIMEOUT = 10      # Seconds to wait for git commands
+BSDTAR_TIMEOUT = 60           # Seconds to wait for bsdtar to extract a database
 
 # Constants
 PACKAGE_SKIP_FLAG = 1
@@ -166,6 +202,7 @@ class ArchVersionComparator:
             return cached
 
         # Use pacman's vercmp if available (authoritative for Arch)
+        r = None
         if ArchVersionComparator._probe_vercmp():
             try:
                 result = subprocess.run(['vercmp', version1, version2],
@@ -173,11 +210,16 @@ class ArchVersionComparator:
                 if result.returncode == 0:
                     v = int(result.stdout.strip())
                     r = -1 if v < 0 else (1 if v > 0 else 0)
-                    cache[key] = r
-                    return r
             except Exception:
                 pass
-        
+        if r is None:
+            r = ArchVersionComparator._compare_fallback(version1, version2)
+        cache[key] = r
+        return r
+    
+    @staticmethod
+    def _compare_fallback(version1: str, version2: str) -> int:
+        """Compare versions without vercmp (epoch, git revisions, packaging.version)"""
         epoch1, ver1 = ArchVersionComparator._split_epoch_version(version1)
         epoch2, ver2 = ArchVersionComparator._split_epoch_version(version2)
         
@@ -279,19 +321,109 @@ def is_version_newer(current_version: str, target_version: str) -> bool:
     """Return True if target_version is newer than current_version"""
     return ArchVersionComparator.is_newer(current_version, target_version)
 
-def parse_pkgbuild_deps(pkgbuild_path):
+# Section markers printed by the PKGBUILD sourcing script -> dependency type
+# collected until the next marker (None between sections)
+_PKGBUILD_DEP_MARKERS = {
+    'DEPENDS_START': 'depends', 'DEPENDS_END': None,
+    'MAKEDEPENDS_START': 'makedepends', 'MAKEDEPENDS_END': None,
+    'CHECKDEPENDS_START': 'checkdepends', 'CHECKDEPENDS_END': None,
+}
+
+# Sources a PKGBUILD and prints its dependency arrays between the markers above
+_PKGBUILD_DEPS_SCRIPT = """#!/bin/bash
+set -e
+cd {pkg_dir} || exit 1
+if [[ ! -f PKGBUILD ]]; then
+    exit 1
+fi
+source PKGBUILD 2>/dev/null || exit 1
+
+# Extract global dependencies first
+echo "DEPENDS_START"
+printf '%s\\n' "${{depends[@]}}"
+echo "DEPENDS_END"
+echo "MAKEDEPENDS_START"
+printf '%s\\n' "${{makedepends[@]}}"
+echo "MAKEDEPENDS_END"
+echo "CHECKDEPENDS_START"
+printf '%s\\n' "${{checkdepends[@]}}"
+echo "CHECKDEPENDS_END"
+"""
+
+# Saved with the dependency cache; a cache written by a different extraction
+# script or marker set is discarded on load
+_PKGBUILD_DEPS_CACHE_VERSION = hashlib.blake2b(
+    (_PKGBUILD_DEPS_SCRIPT + repr(sorted(_PKGBUILD_DEP_MARKERS.items()))).encode(),
+    digest_size=8).hexdigest()
+
+# Parsed PKGBUILD dependencies keyed by PKGBUILD path, each entry holding a
+# hash of the content it was parsed from; persisted across runs in
+# PKGBUILD_DEPS_CACHE_FILE
+_pkgbuild_deps_cache = None
+_pkgbuild_deps_cache_dirty = False
+_pkgbuild_deps_cache_lock = threading.Lock()
+
+def _get_pkgbuild_deps_cache():
+    """
+    Return the PKGBUILD dependency cache, loading it from disk on first use.
+    
+    A cache saved under another _PKGBUILD_DEPS_CACHE_VERSION is dropped, as
+    are entries whose PKGBUILD no longer exists.
+    """
+    global _pkgbuild_deps_cache, _pkgbuild_deps_cache_dirty
+    if _pkgbuild_deps_cache is None:
+        try:
+            if orjson is not None:
+                data = orjson.loads(PKGBUILD_DEPS_CACHE_FILE.read_bytes())
+            else:
+                with open(PKGBUILD_DEPS_CACHE_FILE) as f:
+                    data = json.load(f)
+        except (OSError, ValueError):
+            data = None
+        if not isinstance(data, dict) or data.get('version') != _PKGBUILD_DEPS_CACHE_VERSION:
+            data = {'entries': {}}
+        entries = data['entries']
+        _pkgbuild_deps_cache = {path: entry for path, entry in entries.items() if Path(path).exists()}
+        if len(_pkgbuild_deps_cache) != len(entries):
+            _pkgbuild_deps_cache_dirty = True
+    return _pkgbuild_deps_cache
+
+def save_pkgbuild_deps_cache():
+    """Write the PKGBUILD dependency cache back to disk if it changed"""
+    global _pkgbuild_deps_cache_dirty
+    with _pkgbuild_deps_cache_lock:
+        if not _pkgbuild_deps_cache_dirty or not PKGBUILD_DEPS_CACHE_FILE.parent.is_dir():
+            return
+        tmp_file = PKGBUILD_DEPS_CACHE_FILE.with_name(PKGBUILD_DEPS_CACHE_FILE.name + '.part')
+        try:
+            data = {'version': _PKGBUILD_DEPS_CACHE_VERSION, 'entries': _pkgbuild_deps_cache}
+            if orjson is not None:
+                tmp_file.write_bytes(orjson.dumps(data))
+            else:
+                with open(tmp_file, 'w') as f:
+                    json.dump(data, f)
+            os.replace(tmp_file, PKGBUILD_DEPS_CACHE_FILE)
+            _pkgbuild_deps_cache_dirty = False
+        except OSError as e:
+            print(f"Warning: Could not write PKGBUILD dependency cache: {e}")
+
+def parse_pkgbuild_deps(pkgbuild_path, content=None):
     """
     Extract build dependencies from PKGBUILD file.
     
     Uses bash sourcing to handle variable expansion and array parsing.
     Provides information comes from database files, not PKGBUILDs.
+    Results are cached by PKGBUILD content, so unchanged PKGBUILDs are not
+    sourced again (see save_pkgbuild_deps_cache).
     
     Args:
         pkgbuild_path: Path to PKGBUILD file
+        content: PKGBUILD bytes if the caller already read them
         
     Returns:
         dict: Dictionary with depends, makedepends, checkdepends lists
     """
+    global _pkgbuild_deps_cache_dirty
     deps = {'depends': [], 'makedepends': [], 'checkdepends': []}
     
     if not pkgbuild_path.exists():
@@ -304,56 +436,39 @@ def parse_pkgbuild_deps(pkgbuild_path):
         if not pkg_dir.exists() or not (pkg_dir / "PKGBUILD").exists():
             return deps
         
-        # Create a temporary script to source PKGBUILD and extract dependencies
-        import shlex
-        temp_script = f"""#!/bin/bash
-set -e
-cd {shlex.quote(str(pkg_dir))} || exit 1
-if [[ ! -f PKGBUILD ]]; then
-    exit 1
-fi
-source PKGBUILD 2>/dev/null || exit 1
-
-# Extract global dependencies first
-echo "DEPENDS_START"
-printf '%s\\n' "${{depends[@]}}"
-echo "DEPENDS_END"
-echo "MAKEDEPENDS_START"
-printf '%s\\n' "${{makedepends[@]}}"
-echo "MAKEDEPENDS_END"
-echo "CHECKDEPENDS_START"
-printf '%s\\n' "${{checkdepends[@]}}"
-echo "CHECKDEPENDS_END"
-"""
+        if content is None:
+            content = (pkg_dir / "PKGBUILD").read_bytes()
+        cache_path = str(pkgbuild_path)
+        content_hash = hashlib.blake2b(content, digest_size=16).hexdigest()
+        with _pkgbuild_deps_cache_lock:
+            cached = _get_pkgbuild_deps_cache().get(cache_path)
+        if cached is not None and cached['hash'] == content_hash:
+            return {dep_type: list(values) for dep_type, values in cached['deps'].items()}
+        
+        temp_script = _PKGBUILD_DEPS_SCRIPT.format(pkg_dir=shlex.quote(str(pkg_dir)))
         
         result = subprocess.run(['bash', '-c', temp_script], 
                               capture_output=True, text=True, timeout=10, 
                               errors='replace')
         if result.returncode == 0:
-            output = result.stdout
             current_section = None
+            seen = {dep_type: set() for dep_type in deps}
             
-            for line in output.split('\n'):
+            for line in result.stdout.split('\n'):
                 line = line.strip()
-                if line == "DEPENDS_START":
-                    current_section = "depends"
-                elif line == "DEPENDS_END":
-                    current_section = None
-                elif line == "MAKEDEPENDS_START":
-                    current_section = "makedepends"
-                elif line == "MAKEDEPENDS_END":
-                    current_section = None
-                elif line == "CHECKDEPENDS_START":
-                    current_section = "checkdepends"
-                elif line == "CHECKDEPENDS_END":
-                    current_section = None
-                elif line == "PACKAGE_DEPENDS_START":
-                    current_section = "depends"  # Merge package() depends with global depends
-                elif line == "PACKAGE_DEPENDS_END":
-                    current_section = None
+                if line in _PKGBUILD_DEP_MARKERS:
+                    current_section = _PKGBUILD_DEP_MARKERS[line]
                 elif line and current_section:
-                    if line not in deps[current_section]:  # Avoid duplicates
+                    if line not in seen[current_section]:  # Avoid duplicates
+                        seen[current_section].add(line)
                         deps[current_section].append(line)
+            
+            with _pkgbuild_deps_cache_lock:
+                _get_pkgbuild_deps_cache()[cache_path] = {
+                    'hash': content_hash,
+                    'deps': {dep_type: list(values) for dep_type, values in deps.items()},
+                }
+                _pkgbuild_deps_cache_dirty = True
         else:
             print(f"Warning: Failed to parse PKGBUILD with bash: {result.stderr}")
             
@@ -364,47 +479,371 @@ echo "CHECKDEPENDS_END"
     
     return deps
 
-def parse_database_file(db_filename, include_any=False):
-    """Parse a pacman database file and return packages"""
+# Version values that are safe to take literally from a PKGBUILD without
+# running bash (no expansions, quoting or trailing commands)
+_PLAIN_VERSION_VALUE_RE = re.compile(r'[A-Za-z0-9._+~:-]*')
+
+# pkgver/pkgrel/epoch assignment lines: leading indentation, key, value
+_VERSION_ASSIGNMENT_RE = re.compile(r'^([ \t\f\v]*)(pkgver|pkgrel|epoch)=(.*?)[ \t\r\f\v]*$', re.MULTILINE)
+
+def get_pkgbuild_version(pkgbuild_path, content=None):
+    """
+    Return the full version ([epoch:]pkgver-pkgrel) declared in a PKGBUILD.
+    
+    Plain top-level pkgver/pkgrel/epoch assignments are read directly from
+    the file. Anything more involved (variable expansion, assignments inside
+    blocks) falls back to sourcing the PKGBUILD with bash.
+    
+    Args:
+        pkgbuild_path: Path to PKGBUILD file
+        content: PKGBUILD bytes if the caller already read them
+        
+    Returns:
+        str: Full version string, or None if it could not be determined
+    """
+    pkgbuild_path = Path(pkgbuild_path)
+    values = {}
+    needs_bash = False
+    if content is None:
+        try:
+            content = pkgbuild_path.read_bytes()
+        except OSError:
+            return None
+    content = content.decode('utf-8', errors='replace')
+    
+    # One regex pass finds the assignment lines; the rest of the file is skipped in C
+    for match in _VERSION_ASSIGNMENT_RE.finditer(content):
+        indent, key, value = match.groups()
+        if indent:
+            # Assigned inside a function or conditional
+            needs_bash = True
+            break
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'':
+            value = value[1:-1]
+        if not _PLAIN_VERSION_VALUE_RE.fullmatch(value):
+            needs_bash = True
+            break
+        values[key] = value
+    
+    if not needs_bash and values.get('pkgver') and values.get('pkgrel'):
+        fullver = f"{values['pkgver']}-{values['pkgrel']}"
+        if values.get('epoch'):
+            fullver = f"{values['epoch']}:{fullver}"
+        return fullver
+    
+    temp_script = f"""#!/bin/bash
+cd {shlex.quote(str(pkgbuild_path.parent))}
+source PKGBUILD 2>/dev/null || exit 1
+fullver="$pkgver-$pkgrel"
+if [[ -n $epoch ]]; then
+    fullver="$epoch:$fullver"
+fi
+echo "$fullver"
+"""
+    try:
+        result = subprocess.run(['bash', '-c', temp_script],
+                              capture_output=True, text=True, timeout=10)
+    except Exception:
+        return None
+    if result.returncode == 0:
+        return result.stdout.strip()
+    return None
+
+# One match per %KEY% section of a desc file: the key and its run of
+# non-empty value lines (sections are separated by blank lines)
+_DESC_SECTION_RE = re.compile(r'^%([^%\n]+)%\n((?:(?!%[^%\n]+%$)[^\n]+\n?)*)', re.MULTILINE)
+
+def parse_desc(desc_content):
+    """Parse a pacman database desc file into a dict of KEY -> list of values"""
+    return {key: values.splitlines() for key, values in _DESC_SECTION_RE.findall(desc_content)}
+
+# Same as _DESC_SECTION_RE, for raw (undecoded) desc content
+_DESC_SECTION_BYTES_RE = re.compile(_DESC_SECTION_RE.pattern.encode(), re.MULTILINE)
+
+# desc sections parse_database_file reads; everything else (checksums,
+# signatures, descriptions, ...) is never decoded
+_DATABASE_DESC_KEYS = frozenset({'FILENAME', 'NAME', 'BASE', 'VERSION', 'ARCH',
+                                 'DEPENDS', 'MAKEDEPENDS', 'PROVIDES'})
+
+def parse_desc_bytes(desc_content, keys=None):
+    """
+    Parse raw desc content in one regex pass, decoding only the wanted sections.
+    
+    Args:
+        desc_content: Undecoded desc file content
+        keys: Section names to keep, or None for all of them
+        
+    Returns:
+        dict: KEY -> list of values
+    """
+    desc = {}
+    for key, values in _DESC_SECTION_BYTES_RE.findall(desc_content):
+        key = key.decode()
+        if keys is None or key in keys:
+            desc[key] = values.decode('utf-8', errors='replace').splitlines()
+    return desc
+
+def split_desc_stream(content, keys=None):
+    """
+    Parse concatenated raw desc files (as printed by bsdtar -xO) into desc dicts.
+    
+    A new entry starts at a %FILENAME% section (always first in repo-add
+    output) or at any key the current entry already has, e.g. a second %NAME%.
+    Only sections in keys (all if None) are decoded and kept.
+    """
+    entries = []
+    current = {}
+    seen = set()
+    for key, values in _DESC_SECTION_BYTES_RE.findall(content):
+        key = key.decode()
+        if seen and (key == 'FILENAME' or key in seen):
+            entries.append(current)
+            current = {}
+            seen = set()
+        seen.add(key)
+        if keys is None or key in keys:
+            current[key] = values.decode('utf-8', errors='replace').splitlines()
+    if seen:
+        entries.append(current)
+    return entries
+
+def _size_http_pool(workers):
+    """Grow the shared session's per-host connection pool to fit workers parallel downloads"""
+    global _http_pool_size
+    if _HTTP_SESSION is None:
+        return
+    with _http_pool_lock:
+        if workers <= _http_pool_size:
+            return
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=workers)
+        _HTTP_SESSION.mount('https://', adapter)
+        _HTTP_SESSION.mount('http://', adapter)
+        _http_pool_size = workers
+
+def download_database(url, db_filename):
+    """
+    Download a database file, skipping the transfer if it is unchanged upstream.
+    
+    If a local copy exists, the validators the server sent with it are
+    revalidated: its Last-Modified header ({db_filename}.last-modified) is sent
+    back verbatim as If-Modified-Since and its ETag ({db_filename}.etag) as
+    If-None-Match. The local clock is never used as a validator. A 304 reply
+    leaves the file untouched. Every successful check touches
+    {db_filename}.checked (see database_check_age). New content is written to
+    a temporary file and moved into place, so a failed download never leaves
+    a truncated database behind; the temporary file is removed either way.
+    When python-requests is installed, downloads go through one shared
+    session so connections to the mirror are kept alive between databases
+    (see _size_http_pool).
+    
+    Args:
+        url: Database URL
+        db_filename: Local path to store the database at
+        
+    Returns:
+        bool: True if new content was downloaded, False if unchanged
+    """
+    db_path = Path(db_filename)
+    etag_path = db_path.with_name(db_path.name + '.etag')
+    last_modified_path = db_path.with_name(db_path.name + '.last-modified')
+    part_path = db_path.with_name(db_path.name + '.part')
+    headers = {}
+    if db_path.exists():
+        for header, path in (('If-Modified-Since', last_modified_path), ('If-None-Match', etag_path)):
+            try:
+                headers[header] = path.read_text().strip()
+            except OSError:
+                pass
+    
+    try:
+        if _HTTP_SESSION is not None:
+            # requests exceptions derive from OSError, like urllib's
+            with _HTTP_SESSION.get(url, headers=headers, stream=True, timeout=60) as response:
+                if response.status_code == 304:
+                    _database_checked_path(db_path).touch()
+                    return False
+                response.raise_for_status()
+                with open(part_path, 'wb') as f:
+                    for chunk in response.iter_content(1024 * 1024):
+                        f.write(chunk)
+                response_headers = response.headers
+        else:
+            try:
+                with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=60) as response:
+                    with open(part_path, 'wb') as f:
+                        shutil.copyfileobj(response, f, 1024 * 1024)
+                    # read() returns short instead of raising if the body is cut off
+                    if response.length:
+                        raise urllib.error.ContentTooShortError(
+                            f"{url}: connection closed with {response.length} bytes missing", None)
+                    response_headers = response.headers
+            except urllib.error.HTTPError as e:
+                if e.code == 304:
+                    _database_checked_path(db_path).touch()
+                    return False
+                raise
+        
+        os.replace(part_path, db_path)
+    finally:
+        # Only left over when the download failed part way
+        part_path.unlink(missing_ok=True)
+    
+    for header, path in (('Last-Modified', last_modified_path), ('ETag', etag_path)):
+        value = response_headers.get(header)
+        if value:
+            path.write_text(value)
+        else:
+            path.unlink(missing_ok=True)
+    _database_checked_path(db_path).touch()
+    return True
+
+def _database_checked_path(db_path):
+    """Return the file whose mtime records the last upstream check of db_path"""
+    return db_path.with_name(db_path.name + '.checked')
+
+def database_check_age(db_filename):
+    """
+    Return seconds since db_filename was last downloaded or found unchanged.
+    
+    Kept apart from the database's own mtime, which only changes when new
+    content arrives (the parse cache is keyed on it). Databases downloaded
+    before .checked files existed fall back to their mtime.
+    """
+    import time
+    db_path = Path(db_filename)
+    try:
+        checked = _database_checked_path(db_path).stat().st_mtime
+    except OSError:
+        checked = db_path.stat().st_mtime
+    return time.time() - checked
+
+# Read buffer between the gzip decompressor and tarfile
+_DATABASE_READ_BUFFER_SIZE = 1024 * 1024
+
+@contextlib.contextmanager
+def open_database_tar(db_filename):
+    """
+    Open a gzipped pacman database as a streaming tarfile.
+    
+    Uses isal's igzip for decompression when python-isal is installed,
+    otherwise the standard library gzip module. Decompression happens
+    outside tarfile ('r|' rather than 'r|gz') behind a large read buffer;
+    tarfile's own stream decompressor works in 10 KiB records and is
+    several times slower on databases with thousands of small members.
+    """
+    gz_module = igzip if igzip is not None else gzip
+    with io.BufferedReader(gz_module.open(db_filename, 'rb'), buffer_size=_DATABASE_READ_BUFFER_SIZE) as gz, \
+            tarfile.open(fileobj=gz, mode='r|') as tar:
+        yield tar
+
+def read_database_descs(db_filename, keys=None):
+    """
+    Yield the parsed desc entries of a pacman database in archive order.
+    
+    Extracts with bsdtar (libarchive, always present on Arch) when it is
+    installed, which decompresses and unpacks in C; otherwise falls back to
+    streaming the archive through tarfile. The tarfile path is also used when
+    bsdtar fails, times out, or its output does not split into complete
+    entries. Only sections in keys (all if None) are decoded.
+    """
+    bsdtar = shutil.which('bsdtar')
+    if bsdtar:
+        try:
+            result = subprocess.run([bsdtar, '-xOf', str(db_filename), '*/desc'],
+                                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                    timeout=BSDTAR_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            result = None
+        if result is not None and result.returncode == 0:
+            entries = split_desc_stream(result.stdout, keys)
+            # Entry boundaries are inferred from section names, so only
+            # trust the split if every entry came out with a name and version
+            required = {'NAME', 'VERSION'} if keys is None else {'NAME', 'VERSION'}.intersection(keys)
+            if all(required <= data.keys() for data in entries):
+                yield from entries
+                return
+    # Stream members in archive order instead of indexing the whole
+    # archive with getmembers() first
+    with open_database_tar(db_filename) as tar:
+        for member in tar:
+            # Regular files only: extractfile() cannot follow links in stream mode
+            if member.isfile() and member.name.endswith('/desc'):
+                yield parse_desc_bytes(tar.extractfile(member).read(), keys)
+
+# desc sections whose values repeat across packages
+_INTERNED_DESC_KEYS = ('BASE', 'ARCH', 'DEPENDS', 'MAKEDEPENDS', 'PROVIDES')
+
+def _database_cache_path(db_path):
+    """Return the parse cache file for a database, named after its absolute path"""
+    digest = hashlib.blake2b(str(db_path.resolve()).encode(), digest_size=8).hexdigest()
+    return DATABASE_CACHE_DIR / f"{db_path.name}-{digest}.pickle"
+
+def _read_database_entries(db_filename):
+    """
+    Return the desc entries parse_database_file uses, via an on-disk cache.
+    
+    Parsed entries are pickled under DATABASE_CACHE_DIR, never next to the
+    database, which may live in a local mirror. The cache is keyed on the
+    database's mtime and size; download_database only replaces the file when
+    new content arrives, so a cache hit needs nothing but a stat().
+    """
+    db_path = Path(db_filename)
+    cache_path = _database_cache_path(db_path)
+    st = db_path.stat()
+    cache_key = (sorted(_DATABASE_DESC_KEYS), st.st_mtime_ns, st.st_size)
+    try:
+        with open(cache_path, 'rb') as f:
+            cached_key, entries = pickle.load(f)
+        if cached_key == cache_key:
+            return entries
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+        pass  # Missing or corrupt cache; parse again
+    
+    entries = list(read_database_descs(db_path, _DATABASE_DESC_KEYS))
+    # The same dependency and base names recur across thousands of entries;
+    # interning makes equal names one object, in memory and in the pickle
+    intern = sys.intern
+    for data in entries:
+        for key in _INTERNED_DESC_KEYS:
+            values = data.get(key)
+            if values:
+                data[key] = [intern(value) for value in values]
+    part_path = cache_path.with_name(cache_path.name + '.part')
+    try:
+        DATABASE_CACHE_DIR.mkdir(exist_ok=True)
+        with open(part_path, 'wb') as f:
+            pickle.dump((cache_key, entries), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(part_path, cache_path)
+    except OSError:
+        pass  # Unwritable working directory; just don't cache
+    return entries
+
+def parse_database_file(db_filename, include_any=False, repo='unknown'):
+    """Parse a pacman database file and return packages, tagged with repo"""
     packages = {}
     
     try:
-        with tarfile.open(db_filename, 'r:gz') as tar:
-            for member in tar.getmembers():
-                if member.name.endswith('/desc'):
-                    desc_content = tar.extractfile(member).read().decode('utf-8')
-                    
-                    lines = desc_content.strip().split('\n')
-                    data = {}
-                    current_key = None
-                    
-                    for line in lines:
-                        if line.startswith('%') and line.endswith('%'):
-                            current_key = line[1:-1]
-                            data[current_key] = []
-                        elif current_key and line:
-                            data[current_key].append(line)
+        for data in _read_database_entries(db_filename):
+            if 'NAME' in data and 'VERSION' in data:
+                name = data['NAME'][0]
+                version = data['VERSION'][0]
+                arch = data.get('ARCH', [''])[0]
+                
+                # Skip packages with ARCH=any unless requested
+                if not include_any and arch == 'any':
+                    continue
                     
-                    if 'NAME' in data and 'VERSION' in data:
-                        name = data['NAME'][0]
-                        version = data['VERSION'][0]
-                        arch = data.get('ARCH', [''])[0]
-                        
-                        # Skip packages with ARCH=any unless requested
-                        if not include_any and arch == 'any':
-                            continue
-                            
-                        packages[name] = {
-                            'name': name,
-                            'version': version,
-                            'arch': arch,
-                            'basename': data.get('BASE', [name])[0],
-                            'depends': data.get('DEPENDS', []),
-                            'makedepends': data.get('MAKEDEPENDS', []),
-                            'provides': data.get('PROVIDES', []),
-                            'filename': data.get('FILENAME', [''])[0],
-                            'repo': 'unknown'
-                        }
+                packages[name] = {
+                    'name': name,
+                    'version': version,
+                    'arch': arch,
+                    'basename': data.get('BASE', [name])[0],
+                    'depends': data.get('DEPENDS', []),
+                    'makedepends': data.get('MAKEDEPENDS', []),
+                    'provides': data.get('PROVIDES', []),
+                    'filename': data.get('FILENAME', [''])[0],
+                    'repo': repo
+                }
     except Exception as e:
         print(f"Error parsing {db_filename}: {e}")
     
@@ -418,7 +857,6 @@ def load_database_packages(urls, arch_suffix, download=True, include_any=False,
     
     def download_and_parse(url):
         """Download and immediately parse a database file"""
-        import time
         try:
             db_filename = url.split('/')[-1].replace('.db', f'{arch_suffix}.db')
             db_path = Path(db_filename)
@@ -433,15 +871,12 @@ def load_database_packages(urls, arch_suffix, download=True, include_any=False,
                     repo_name = url.split('/')[-4]
                     if repo_name.endswith('-testing'):
                         repo_name = repo_name.replace('-testing', '')
-                    repo_packages = parse_database_file(str(local_path), include_any=include_any)
-                    for name, pkg in repo_packages.items():
-                        pkg['repo'] = repo_name
-                    return repo_packages
+                    return parse_database_file(str(local_path), include_any=include_any, repo=repo_name)
 
             # Skip download if file exists and is less than 60 seconds old
             needs_download = download
             if db_path.exists():
-                age = time.time() - db_path.stat().st_mtime
+                age = database_check_age(db_path)
                 if age < 60:
                     needs_download = False
                     if verbose:
@@ -454,8 +889,8 @@ def load_database_packages(urls, arch_suffix, download=True, include_any=False,
                 elif needs_download:
                     if verbose:
                         print(f"Downloading {db_filename}...")
-                subprocess.run(["wget", "-q", "-O", db_filename, url], check=True)
-                db_path.touch()  # Update mtime (wget preserves server timestamp)
+                if not download_database(url, db_filename) and verbose:
+                    print(f"{db_filename} unchanged upstream")
             elif download:
                 if verbose:
                     print(f"Using existing {db_filename}")
@@ -467,14 +902,9 @@ def load_database_packages(urls, arch_suffix, download=True, include_any=False,
             
             if verbose:
                 print(f"Parsing {db_filename}...")
-            repo_packages = parse_database_file(db_filename, include_any=include_any)
-            
-            for name, pkg in repo_packages.items():
-                pkg['repo'] = repo_name
-            
-            return repo_packages
+            return parse_database_file(db_filename, include_any=include_any, repo=repo_name)
                     
-        except subprocess.CalledProcessError as e:
+        except OSError as e:
             print(f"Warning: Failed to download {url}: {e}")
             return {}
         except Exception as e:
@@ -482,9 +912,12 @@ def load_database_packages(urls, arch_suffix, download=True, include_any=False,
             return {}
     
     packages = {}
+    if not urls:
+        return packages
     
-    # Use ThreadPoolExecutor for parallel downloads
-    with concurrent.futures.ThreadPoolExecutor(max_workers=min(4, len(urls))) as executor:
+    # Download and parse every repository at once; each worker mostly waits on the network
+    _size_http_pool(len(urls))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(urls)) as executor:
         future_to_url = {executor.submit(download_and_parse, url): url for url in urls}
         
         for future in concurrent.futures.as_completed(future_to_url):
@@ -651,20 +1084,20 @@ class BuildUtils:
             return 0
         
         try:
-            cache_files = list(cache_path.glob("*.pkg.tar.*"))
+            prefixes = tuple(f"{pkg_name}-" for pkg_name in pkg_names)
             removed_count = 0
             
-            for cache_file in cache_files:
-                # Check if this cache file matches any of the package names
-                for pkg_name in pkg_names:
-                    if cache_file.name.startswith(f"{pkg_name}-"):
-                        try:
-                            cache_file.unlink()
-                            print(f"  Removed: {cache_file.name}")
-                            removed_count += 1
-                            break
-                        except Exception as e:
-                            print(f"  Warning: Failed to remove {cache_file.name}: {e}")
+            # One scandir pass; str.startswith checks all package prefixes at once
+            with os.scandir(cache_path) as entries:
+                for entry in entries:
+                    if '.pkg.tar.' not in entry.name or not entry.name.startswith(prefixes):
+                        continue
+                    try:
+                        os.unlink(entry.path)
+                        print(f"  Removed: {entry.name}")
+                        removed_count += 1
+                    except Exception as e:
+                        print(f"  Warning: Failed to remove {entry.name}: {e}")
             
             return removed_count
         except Exception as e:
@@ -768,23 +1201,114 @@ def compare_bin_package_versions(provided_version, x86_version):
         # If version parsing fails, assume outdated
         return -1
 
-def find_missing_dependencies(packages, x86_packages, target_packages):
-    """Find dependencies that exist in x86_64 but are completely missing from target architecture"""
-    missing_deps = set()
-    processed = set()
+_DEP_CONSTRAINT_RE = re.compile(r'[<>=]')
+
+@functools.lru_cache(maxsize=None)
+def extract_dep_name(dep_str):
+    """
+    Extract package name from dependency string like 'pkg>=1.0'.
     
-    # Build provides mapping for target architecture packages
+    Memoized: the same dependency strings recur across thousands of
+    packages and every dependency pass.
+    """
+    return _DEP_CONSTRAINT_RE.split(dep_str, 1)[0].strip()
+
+def find_strongly_connected_components(graph):
+    """
+    Find strongly connected components using Tarjan's algorithm.
+    Returns list of SCCs, each SCC is a list of nodes.
+    
+    Iterative: an explicit stack of (node, successor iterator) frames stands
+    in for recursion, so long dependency chains cannot hit the recursion limit.
+    """
+    index = {}
+    lowlinks = {}
+    on_stack = set()
+    stack = []
+    sccs = []
+    counter = 0
+    
+    for root in graph:
+        if root in index:
+            continue
+        index[root] = lowlinks[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(graph.get(root, ())))]
+        
+        while work:
+            node, successors = work[-1]
+            for successor in successors:
+                if successor not in index:
+                    # Descend into successor; resume node's iterator afterwards
+                    index[successor] = lowlinks[successor] = counter
+                    counter += 1
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, iter(graph.get(successor, ()))))
+                    break
+                elif successor in on_stack and index[successor] < lowlinks[node]:
+                    lowlinks[node] = index[successor]
+            else:
+                # All successors visited: node is finished
+                work.pop()
+                if lowlinks[node] == index[node]:
+                    component = []
+                    while True:
+                        w = stack.pop()
+                        on_stack.discard(w)
+                        component.append(w)
+                        if w == node:
+                            break
+                    sccs.append(component)
+                if work:
+                    parent = work[-1][0]
+                    if lowlinks[node] < lowlinks[parent]:
+                        lowlinks[parent] = lowlinks[node]
+    
+    return sccs
+
+def build_target_provides(target_packages):
+    """
+    Map every name a target architecture package satisfies to that package.
+    
+    Covers package names, pkgbases and provides entries. Provides are added
+    first, so a real package name or pkgbase always maps to its own package
+    rather than to something that merely provides it.
+    
+    Args:
+        target_packages: Dictionary of target architecture packages
+        
+    Returns:
+        dict: Name -> package dict
+    """
     target_provides = {}
+    for pkg in target_packages.values():
+        for provide in pkg.get('provides', ()):
+            target_provides[provide.partition('=')[0]] = pkg
     for name, pkg in target_packages.items():
-        target_provides[name] = pkg
-        basename = pkg.get('basename', name)
-        target_provides[basename] = pkg
-        for provide in pkg.get('provides', []):
-            provide_name = provide.split('=')[0]
-            target_provides[provide_name] = pkg
-    
-    def check_dependencies_recursive(pkg_list):
-        """Recursively check dependencies and add missing ones"""
+        target_provides[pkg.get('basename', name)] = pkg
+    target_provides.update(target_packages)
+    return target_provides
+
+def find_missing_dependencies(packages, x86_packages, target_packages, target_provides=None):
+    """
+    Find dependencies that exist in x86_64 but are completely missing from target architecture.
+    
+    target_provides is the build_target_provides() map for target_packages;
+    pass it in when the caller already has one.
+    """
+    missing_deps = set()
+    processed = set()
+    
+    if target_provides is None:
+        target_provides = build_target_provides(target_packages)
+    
+    # Check dependencies level by level: each pass looks at the packages found
+    # missing in the previous one, so deep chains need no recursion
+    pkg_list = packages
+    while pkg_list:
         new_missing = set()
         
         for pkg in pkg_list:
@@ -796,7 +1320,7 @@ def find_missing_dependencies(packages, x86_packages, target_packages):
                 all_deps += pkg['checkdepends']
                 
             for dep in all_deps:
-                dep_name = dep.split('=')[0].split('>')[0].split('<')[0]
+                dep_name = extract_dep_name(dep)
                 
                 # Skip if already processed or provided by target
                 if dep_name in processed or dep_name in target_provides:
@@ -818,18 +1342,8 @@ def find_missing_dependencies(packages, x86_packages, target_packages):
                     new_missing.add(dep_name)
                     processed.add(dep_name)
         
-        # Recursively check dependencies of newly found missing packages
-        if new_missing:
-            missing_pkg_data = []
-            for dep_name in new_missing:
-                if dep_name in x86_packages:
-                    missing_pkg_data.append(x86_packages[dep_name])
-            
-            if missing_pkg_data:
-                check_dependencies_recursive(missing_pkg_data)
-    
-    # Start with the initial packages
-    check_dependencies_recursive(packages)
+        # Check dependencies of newly found missing packages next
+        pkg_list = [x86_packages[dep_name] for dep_name in new_missing if dep_name in x86_packages]
     
     return missing_deps
 
@@ -969,7 +1483,6 @@ def load_all_packages_parallel(download=True, x86_repos=None, target_repos=None,
 
 def load_packages_with_any(urls, arch_suffix, download=True, include_any=True, verbose=False):
     """Load packages including ARCH=any packages"""
-    import subprocess
     from concurrent.futures import ThreadPoolExecutor, as_completed
     packages = {}
     
@@ -981,7 +1494,7 @@ def load_packages_with_any(urls, arch_suffix, download=True, include_any=True, v
             if download:
                 if verbose:
                     print(f"Downloading {db_filename}...")
-                subprocess.run(["wget", "-q", "-O", db_filename, url], check=True)
+                download_database(url, db_filename)
             else:
                 if verbose:
                     print(f"Using existing {db_filename}...")
@@ -989,21 +1502,19 @@ def load_packages_with_any(urls, arch_suffix, download=True, include_any=True, v
             repo_name = url.split('/')[-4]
             if verbose:
                 print(f"Parsing {db_filename}...")
-            repo_packages = parse_database_file(db_filename, include_any=include_any)
-            
-            # Add repo info to each package
-            for name, pkg in repo_packages.items():
-                pkg['repo'] = repo_name
-            
-            return repo_packages
-        except subprocess.CalledProcessError as e:
+            return parse_database_file(db_filename, include_any=include_any, repo=repo_name)
+        except OSError as e:
             print(f"Warning: Failed to download {url}: {e}")
             return {}
         except Exception as e:
             print(f"Warning: Failed to parse {db_filename}: {e}")
             return {}
     
+    if not urls:
+        return packages
+    
     # Process all URLs in parallel
+    _size_http_pool(len(urls))
     with ThreadPoolExecutor(max_workers=len(urls)) as executor:
         future_to_url = {executor.submit(download_and_parse, url): url for url in urls}
         